@@ -1,10 +1,54 @@
 import os
-import sys
+import zlib
+import heapq
+import struct
+import argparse
 import inspect
+from array import array
+from math import log2
+from collections import deque, Counter
+from concurrent.futures import ProcessPoolExecutor
 from time import sleep
 
+from huffman_profiling import profiler
+from ID1_ID2_decompression import read_dictionary, bounded_map
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, the byte encoding falls back to pure Python
+    np = None
+
+
+ORDER_HEADER_TAG = "O|"  # tree order lines tag, a legacy order line has single letter or number entries only
+CANONICAL_HEADER_TAG = "C|"  # a preorder line starts with the root's number, so it never starts with this tag
+STREAM_HEADER_TAG = "S|"  # first line tag of a streamed file, a legacy file starts with a placeholder and a digit
+STREAM_CHUNK_SIZE = 1 << 20  # letters per chunk (and per encoded block) in stream mode
+CODES_PER_WRITE = 256  # codes shifted into one integer per BitWriter.write when NumPy is not installed
+STORED_HEADER_TAG = "R|"  # first line tag of a text file stored raw, the rest of the file is the original text
+PARALLEL_HEADER_TAG = "P|"  # first line tag of a file compressed in parallel blocks mode
+BLOCK_INDEX_TAG = "I|"  # last line tag of a file compressed in parallel blocks mode
+CONTAINER_MAGIC = b'\x89HUF'  # binary container, the high first byte is never the start of a text format file
+CONTAINER_VERSION = 1
+CONTAINER_FLAG_BYTES = 1  # the original data is bytes (letters are byte values), not text
+CONTAINER_FLAG_SEEK_INDEX = 2  # a seek index follows the payload, see write_container
+SEEK_INTERVAL = 1 << 16  # letters between two seek index entries
+CONTAINER_FLAG_INTERLEAVED = 4  # the payload is several bitstreams, the letters are dealt to them round-robin
+INTERLEAVE_STREAMS = 256  # most bitstreams with --interleave and no amount, see interleave_streams
+INTERLEAVE_MIN_STREAMS = 64  # fewest of them, the NumPy lockstep decoder needs this many (LOCKSTEP_MIN_STREAMS)
+INTERLEAVE_STREAM_LETTERS = 1 << 12  # letters per bitstream, bounds the 9 bytes of length and padding per stream
+CONTAINER_FLAG_STORED = 8  # the payload is the original data as it is (utf-8 text, or bytes), no code table
+INCOMPRESSIBLE_RATIO = 0.97  # the sample check stores the data raw when the entropy estimate is above this share
+SAMPLE_SIZE = 1 << 12  # letters per sample in the sample check
+SAMPLES = 16  # samples spread evenly over the data
+DRIFT_THRESHOLD = 0.02  # bits per byte the current table may lose before --append builds a new one
+DICTIONARY_MAGIC = b'\x89HUD'  # pre-trained code table file
+DICTIONARY_VERSION = 1
+DICTIONARY_MESSAGE_MAGIC = b'\x89HM'  # message compressed with a pre-trained dictionary
+
 
 class Node:
+    __slots__ = ("left", "right", "letters", "node_count", "code", "unique_value")
+
     def __init__(self, left=None, right=None, letters=None, count=None, code="", unique_value=0):
         self.left = left
         self.right = right
@@ -54,42 +98,48 @@ def read_file(file_path):
         print(str(e))
 
 
-def inorder_interval(root: Node, inorder_list=[]):
+def inorder_nodes(root: Node):
     """
-    Inorder interval on a tree: left --> root --> right
+    Inorder walk on a tree: left --> root --> right, with an explicit stack (no recursion limit on deep trees)
     :param root: Node type
-    :param inorder_list: List - KEEP IT EMPTY unless you want to add the tree from the root param to a list of your own
-    :return: complete inorder list
+    :return: generator of the nodes
     """
-    if not root:
-        return
-    inorder_interval(root.left)
-    if len(root.get_letters()) == 1:
-        inorder_list.append(root.get_letters())
-    else:
-        inorder_list.append(str(root.get_unique_value()))
-    inorder_interval(root.right)
-
-    return inorder_list
+    stack = []
+    node = root
+    while stack or node:
+        while node:
+            stack.append(node)
+            node = node.left
+        node = stack.pop()
+        yield node
+        node = node.right
 
 
-def preorder_interval(root, preorder_list=[]):
+def preorder_nodes(root: Node):
     """
-    Preorder interval on a tree: root --> left --> right
+    Preorder walk on a tree: root --> left --> right, with an explicit stack (no recursion limit on deep trees)
     :param root: Node type
-    :param preorder_list: List - KEEP IT EMPTY unless you want to add the tree from the root param to a list of your own
-    :return: complete preorder list
+    :return: generator of the nodes
     """
-    if not root:
-        return
-    if len(root.get_letters()) == 1:
-        preorder_list.append(root.get_letters())
-    else:
-        preorder_list.append(str(root.get_unique_value()))
-    preorder_interval(root.left, preorder_list)
-    preorder_interval(root.right, preorder_list)
+    stack = [root] if root else []
+    while stack:
+        node = stack.pop()
+        yield node
+        if node.right:
+            stack.append(node.right)
+        if node.left:
+            stack.append(node.left)
 
-    return preorder_list
+
+def order_entry(node: Node) -> str:
+    """
+    Unambiguous header entry of a node: a letter is written as its ord() number and a junction as "*" and its
+    unique value, so digits, commas and line breaks in the alphabet need no special case
+    :return: string
+    """
+    if len(node.get_letters()) == 1:
+        return str(ord(node.get_letters()))
+    return "*" + str(node.get_unique_value())
 
 
 def filter_abc(text: str) -> dict:
@@ -111,6 +161,57 @@ def filter_abc(text: str) -> dict:
         raise e
 
 
+def entropy_bits(histogram: dict) -> float:
+    """
+    Shannon entropy of a histogram, the least bits any letter by letter code needs for these letters
+    (a Huffman code needs less than one bit per letter more)
+    :param histogram: letter histogram
+    :return: bits, for all the letters together
+    """
+    letters_amount = sum(histogram.values())
+    return sum(count * log2(letters_amount / count) for count in histogram.values())
+
+
+def sample_histogram(text, sample_size=SAMPLE_SIZE, samples=SAMPLES) -> dict:
+    """
+    Histogram of a few slices spread evenly over the text, the whole text's histogram if it is short
+    :param text: text, or bytes (the letters are then byte values)
+    :param sample_size: letters per slice
+    :param samples: slices amount
+    :return: letter histogram
+    """
+    if len(text) <= sample_size * samples:
+        return Counter(text)
+    histogram = Counter()
+    step = (len(text) - sample_size) // (samples - 1)
+    for i in range(0, samples):
+        histogram.update(text[i * step: i * step + sample_size])
+    return histogram
+
+
+def looks_incompressible(histogram: dict, letters_amount: int, stored_size: int) -> bool:
+    """
+    Entropy estimate check, no tree is built: is the data close to (or above) its stored size anyway
+    :param histogram: letter histogram of the data or of a sample of it (see sample_histogram)
+    :param letters_amount: letters in the whole data
+    :param stored_size: bytes the data takes stored raw
+    :return: bool
+    """
+    sampled = sum(histogram.values())
+    if not sampled:
+        return False
+    return entropy_bits(histogram) * letters_amount / sampled / 8 >= INCOMPRESSIBLE_RATIO * stored_size
+
+
+def encoded_size(histogram: dict, code_lengths: dict) -> int:
+    """
+    :param histogram: letter histogram
+    :param code_lengths: letter - code length hashmap
+    :return: bytes of the encoded letters, known before encoding them
+    """
+    return (sum(count * code_lengths[letter] for letter, count in histogram.items()) + 7) // 8
+
+
 def make_text_binary(text: str, huffman_code: dict) -> str:
     """
     Make one long string from the original text string using the huffman decoding hash map
@@ -124,6 +225,104 @@ def make_text_binary(text: str, huffman_code: dict) -> str:
     return binary_text
 
 
+class BitWriter:
+    """
+    Pack bits straight into a bytearray.
+    Keeps less than one byte of pending bits in an integer accumulator, every full byte goes to the output buffer.
+    """
+    def __init__(self):
+        self.buffer = bytearray()
+        self.accumulator = 0
+        self.pending_bits = 0
+
+    def write(self, value: int, length: int):
+        """
+        Append the `length` lower bits of `value`, most significant bit first
+        """
+        self.accumulator = (self.accumulator << length) | value
+        self.pending_bits += length
+        self._flush()
+
+    def _flush(self):
+        full_bytes, self.pending_bits = divmod(self.pending_bits, 8)
+        if full_bytes:
+            self.buffer += (self.accumulator >> self.pending_bits).to_bytes(full_bytes, 'big')
+            self.accumulator &= (1 << self.pending_bits) - 1
+
+    def getvalue(self) -> bytes:
+        """
+        :return: the written bits, the last byte is padded with zeros on the right
+        """
+        if self.pending_bits:
+            return bytes(self.buffer) + bytes([self.accumulator << (8 - self.pending_bits)])
+        return bytes(self.buffer)
+
+
+def make_text_bytes(text: str, huffman_code: dict, histogram=None, chunk_size=1 << 16) -> bytes:
+    """
+    Encode text by the huffman code straight into bytes.
+    The output is the same as zero_padding(make_text_binary(text, huffman_code)) packed to bytes:
+    first byte is the padding amount (as an ASCII digit), then the zero padding, then the encoded text.
+    Only `chunk_size` letters are turned into a bits string at a time, so memory is about the size of the output.
+    :param text: text
+    :param huffman_code: letter hashmap
+    :param histogram: letter histogram of text (dict or list of (letter, count) tuples), counted here if not given
+    :param chunk_size: how many letters to encode at a time
+    :return: encoded bytes
+    """
+    if histogram is None:
+        histogram = Counter(text)
+    if isinstance(histogram, dict):
+        histogram = histogram.items()
+    total_bits = sum(len(huffman_code[letter]) * count for letter, count in histogram)
+    modulo = total_bits % 8
+    writer = BitWriter()
+    if modulo:
+        writer.write(ord(str(8 - modulo)), 8)  # first byte, how many pads
+        writer.write(0, 8 - modulo)
+    else:  # if we did not pad at all
+        writer.write(48, 8)
+    write_text_codes(writer, text, huffman_code, chunk_size)
+    return writer.getvalue()
+
+
+def write_text_codes(writer: BitWriter, text: str, huffman_code: dict, chunk_size=1 << 16):
+    """
+    Write the codes of the text's letters to a BitWriter as (value, length) integers, no code strings are joined.
+    With NumPy the letters' code points index code and length arrays and pack_codes packs a chunk at a time,
+    otherwise every CODES_PER_WRITE codes are shifted into one integer and written at once
+    :param writer: BitWriter
+    :param text: text
+    :param huffman_code: letter hashmap
+    :param chunk_size: how many letters to encode at a time
+    :return: None
+    """
+    code_values = {letter: (int(code, 2), len(code)) for letter, code in huffman_code.items()}
+    if np is not None and text and max(length for value, length in code_values.values()) <= 32:
+        codes = np.zeros(max(map(ord, code_values)) + 1, dtype=np.int64)
+        lengths = np.zeros(len(codes), dtype=np.int64)
+        for letter, (value, length) in code_values.items():
+            codes[ord(letter)] = value
+            lengths[ord(letter)] = length
+        carry_bits = writer.pending_bits
+        carry_word = writer.accumulator << (32 - carry_bits)
+        for i in range(0, len(text), chunk_size):
+            symbols = np.frombuffer(text[i: i + chunk_size].encode('utf-32-le', 'surrogatepass'), dtype='<u4')
+            encoded, carry_word, carry_bits = pack_codes(codes[symbols], lengths[symbols], carry_word, carry_bits)
+            writer.buffer += encoded
+        writer.accumulator = carry_word >> (32 - carry_bits)
+        writer.pending_bits = carry_bits
+        writer.write(0, 0)  # moves the full bytes of the last word to the buffer
+        return
+    for i in range(0, len(text), CODES_PER_WRITE):
+        accumulator = 0
+        bits = 0
+        for value, length in map(code_values.__getitem__, text[i: i + CODES_PER_WRITE]):
+            accumulator = (accumulator << length) | value
+            bits += length
+        writer.write(accumulator, bits)
+
+
 def find_placeholder(text):
     """
     Finds the unused character in text
@@ -186,29 +385,109 @@ def write_to_txt_file(text: str, file_name: str):
     new_file.close()
 
 
+def find_bytes_placeholder(data: bytes):
+    """
+    Same as find_placeholder for bytes.
+    Also skips the characters that escape the bytes lower than 32 (64 - byte), otherwise an escaped byte followed
+    by the placeholder reads back as an escaped 127
+    :param data: bytes
+    :return: char, ASCII value
+    """
+    used = set(data)
+    used.update(64 - integer_bits for integer_bits in range(0, 32) if integer_bits in used)
+    for idx in range(32, 256):
+        if idx != 127 and idx not in used:
+            return chr(idx)
+    for idx in range(0, 32):
+        if idx != 8:  # bytes lower than 32 are always escaped, so they are never written as they are
+            return chr(idx)
+
+
+def escape_bytes(data: bytes) -> str:
+    """
+    Escape encoded bytes the same way write_to_txt_file does, with a lookup table per byte.
+    :param data: encoded bytes
+    :return: placeholder followed by the escaped text
+    """
+    placeholder = find_bytes_placeholder(data)
+    escape = [chr(integer_bits) for integer_bits in range(0, 256)]
+    for integer_bits in range(0, 32):
+        escape[integer_bits] = placeholder + chr(64 - integer_bits)
+    escape[127] = placeholder + placeholder
+    return placeholder + ''.join(map(escape.__getitem__, data))
+
+
+def write_bytes_to_txt_file(data: bytes, file_name: str):
+    """
+    Same as write_to_txt_file, for the output of make_text_bytes.
+    Every byte is escaped with a lookup table instead of slicing and parsing a bits string.
+    :param data: encoded bytes
+    :param file_name: file name to write to
+    :return: None
+    """
+    with open(file_name, 'w', encoding='utf-8') as new_file:
+        new_file.write(escape_bytes(data))  # file first byte --> place holder!
+        new_file.write('\n')
+
+
+def write_stored_file(text: str, file_name: str):
+    """
+    Store the text raw: STORED_HEADER_TAG line, then the text as it is
+    :param text: original text
+    :param file_name: file name to write to
+    :return: None
+    """
+    with open(file_name, 'w', encoding='utf-8') as new_file:
+        new_file.write(STORED_HEADER_TAG + '\n')
+        new_file.write(text)
+
+
+def write_stored_chunks(file_path, file_name: str, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Same as write_stored_file for a file of any size, copied chunk by chunk
+    :param file_path: file to store
+    :param file_name: file name to write to
+    :param chunk_size: letters per chunk
+    :return: None
+    """
+    with open(file_name, 'w', encoding='utf-8') as new_file:
+        new_file.write(STORED_HEADER_TAG + '\n')
+        for chunk in read_chunks(file_path, chunk_size):
+            new_file.write(chunk)
+
+
+def stored_block(text: str) -> str:
+    """
+    Block line of a block stored raw: STORED_HEADER_TAG, the length of the text in letters, "|", then the text as it
+    is. The text may hold line breaks, the length tells where the block ends
+    :param text: block text
+    :return: block line, without the line break
+    """
+    return STORED_HEADER_TAG + str(len(text)) + "|" + text
+
+
+def smaller_block(line: str, text: str) -> str:
+    """
+    :param line: the encoded block line of the text
+    :param text: block text
+    :return: the encoded line, or the stored_block of the text when the encoded one is not smaller in the file
+    """
+    stored = stored_block(text)
+    return stored if len(stored.encode('utf-8')) <= len(line.encode('utf-8')) else line
+
+
 def write_orders_to_file(inorder: list, preorder: list, file_name: str):
     """
-    Write inorder and preorder lists to file
-    :param inorder: Left-Root-Right
-    :param preorder: Root-Left-Right
+    Write inorder and preorder lists to file, one line each: ORDER_HEADER_TAG and the comma separated entries
+    :param inorder: Left-Root-Right, order_entry of every node
+    :param preorder: Root-Left-Right, order_entry of every node
     :param file_name: string
     :return:
     """
-    file = open(file_name, "a")
-    for idx, node in enumerate(inorder):
-        if node == "\n":
-            node = "\\n"
-        file.write(node)
-        if idx != len(inorder)-1:
-            file.write(",")
-    file.write("\n")
-    for idx, node in enumerate(preorder):
-        if node == "\n":
-            node = "\\n"
-        file.write(node)
-        if idx != len(preorder)-1:
-            file.write(",")
-    file.close()
+    with open(file_name, "a") as file:
+        file.write(ORDER_HEADER_TAG + ",".join(inorder))
+        file.write("\n")
+        file.write(ORDER_HEADER_TAG + ",".join(preorder))
 
 
 def create_huffman_tree(nodes_list: list, unique_value: int):
@@ -225,7 +504,7 @@ def create_huffman_tree(nodes_list: list, unique_value: int):
         parent_code = left.get_code()[:-1]
         parent = Node(left=left,
                       right=right,
-                      letters=left.get_letters() + "_" + right.get_letters(),
+                      letters="",
                       count=count1 + count2,
                       code=parent_code,
                       unique_value=unique_value)
@@ -235,28 +514,790 @@ def create_huffman_tree(nodes_list: list, unique_value: int):
     return nodes_list[0][0]
 
 
-def build_huffman_codes(node: Node, left=True, code='', hashmap={}):
+def sort_histogram(histogram: dict) -> list:
+    """
+    Sort a letter histogram from the most common letter to the rarest one.
+    Letters with the same count are ordered by the letter itself, so the same histogram always gives the same list
+    (and the same tree) no matter in which order the letters were first seen.
+    :param histogram: letter histogram
+    :return: list of (letter, count) tuples
+    """
+    return sorted(histogram.items(), key=lambda x: (-x[1], x[0]))
+
+
+def create_huffman_tree_heap(nodes_list: list, unique_value: int):
+    """
+    Build Huffman tree with a priority queue, O(n log n).
+    Ties between equal counts are broken by insertion order: leaves first (rarest to most common, as in nodes_list),
+    then junctions in the order they were created. This gives the same tree for the same nodes_list every time.
+    :param nodes_list: list of (Node, count) tuples, sorted from the most common to the rarest
+    :param unique_value: integer
+    :return: Tree's root
+    """
+    heap = [(count, order, node) for order, (node, count) in enumerate(reversed(nodes_list))]
+    heapq.heapify(heap)
+    order = len(heap)
+    while len(heap) > 1:
+        count1, _, left = heapq.heappop(heap)
+        count2, _, right = heapq.heappop(heap)
+        parent = Node(left=left, right=right, letters="", count=count1 + count2, unique_value=unique_value)
+        unique_value -= 1
+        heapq.heappush(heap, (count1 + count2, order, parent))
+        order += 1
+    return heap[0][2]
+
+
+def create_huffman_tree_two_queues(nodes_list: list, unique_value: int):
+    """
+    Build Huffman tree in linear time with two queues (van Leeuwen).
+    The leaves queue holds the sorted leaves, the junctions queue holds the new junctions, which are created with
+    non-decreasing counts, so the two smallest nodes are always at the heads of the two queues.
+    On equal counts the leaf is taken first, so the result is identical to create_huffman_tree_heap.
+    :param nodes_list: list of (Node, count) tuples, MUST be sorted from the most common to the rarest
+    :param unique_value: integer
+    :return: Tree's root
+    """
+    leaves = deque(reversed(nodes_list))
+    junctions = deque()
+
+    def pop_smallest():
+        if not junctions or (leaves and leaves[0][1] <= junctions[0][1]):
+            return leaves.popleft()
+        return junctions.popleft()
+
+    while len(leaves) + len(junctions) > 1:
+        left, count1 = pop_smallest()
+        right, count2 = pop_smallest()
+        parent = Node(left=left, right=right, letters="", count=count1 + count2, unique_value=unique_value)
+        unique_value -= 1
+        junctions.append((parent, count1 + count2))
+    return (leaves or junctions)[0][0]
+
+
+def is_sorted_histogram(nodes_list: list) -> bool:
+    """
+    Check if a nodes list is sorted from the most common to the rarest
+    :param nodes_list: list of (Node, count) tuples
+    :return: bool
+    """
+    return all(nodes_list[i][1] >= nodes_list[i + 1][1] for i in range(len(nodes_list) - 1))
+
+
+def build_huffman_tree(nodes_list: list, unique_value: int):
+    """
+    Build Huffman tree with the fastest engine for the input:
+    the linear two-queues engine when nodes_list is already sorted, the heap engine otherwise.
+    Both engines give the same tree for a sorted nodes_list.
+    :param nodes_list: list of (Node, count) tuples
+    :param unique_value: integer
+    :return: Tree's root
+    """
+    if is_sorted_histogram(nodes_list):
+        return create_huffman_tree_two_queues(nodes_list, unique_value)
+    return create_huffman_tree_heap(nodes_list, unique_value)
+
+
+def huffman_code_values(root: Node) -> dict:
+    """
+    Codes of all the tree's leaves as (int value, bit length) pairs, walking the tree with an explicit stack.
+    No code strings are built on the way down and there is no recursion limit on deep trees.
+    :param root: type Node, consider as the root of our huffman-tree
+    :return: letter - (code value, code length) hashmap
     """
-    recursive function that apply the huffman code algorithm
+    code_values = {}
+    stack = [(root, 0, 0)]
+    while stack:
+        node, value, length = stack.pop()
+        l, r = node.children()
+        if not l and not r:
+            code_values[str(node)] = (value, length or 1)  # a lone root leaf (one letter alphabet) gets the code 0
+            continue
+        if r:
+            stack.append((r, value << 1 | 1, length + 1))
+        if l:
+            stack.append((l, value << 1, length + 1))
+    return code_values
+
+
+class FlatHuffmanTree:
+    """
+    Huffman tree in parallel arrays instead of Node objects, for building code tables.
+    Nodes are numbers: the leaves are 0..n-1 (rarest to most common, as the two-queues engine takes them), the
+    junctions follow in the order they were created and the root is the last one. left, right and count are
+    arrays indexed by the node number (left and right are -1 for a leaf), so the memory is a few machine words
+    per node. The tree is the same one create_huffman_tree_two_queues builds from the same sorted histogram.
+    """
+    __slots__ = ("letters", "left", "right", "count")
+
+    def __init__(self, text_histogram: list):
+        """
+        :param text_histogram: list of (letter, count) tuples, output of sort_histogram
+        """
+        leaves_amount = len(text_histogram)
+        size = max(2 * leaves_amount - 1, 0)
+        self.letters = [letter for letter, count in reversed(text_histogram)]
+        self.left = array('l', [-1]) * size
+        self.right = array('l', [-1]) * size
+        self.count = array('q', [0]) * size
+        for i, (letter, count) in enumerate(reversed(text_histogram)):
+            self.count[i] = count
+
+        leaf = 0
+        junction = leaves_amount  # next junction to take
+        for new in range(leaves_amount, size):
+            children = []
+            for _ in range(2):
+                if junction == new or (leaf < leaves_amount and self.count[leaf] <= self.count[junction]):
+                    children.append(leaf)
+                    leaf += 1
+                else:
+                    children.append(junction)
+                    junction += 1
+            self.left[new], self.right[new] = children
+            self.count[new] = self.count[children[0]] + self.count[children[1]]
+
+    def code_lengths(self) -> dict:
+        """
+        Depth of every leaf, from the root down in one pass over the junctions (a parent is always created after
+        its children). A single letter alphabet still gets a 1 bit code.
+        :return: letter - code length hashmap
+        """
+        leaves_amount = len(self.letters)
+        depth = array('l', [0]) * len(self.count)
+        for node in range(len(self.count) - 1, leaves_amount - 1, -1):
+            depth[self.left[node]] = depth[self.right[node]] = depth[node] + 1
+        return {letter: max(depth[i], 1) for i, letter in enumerate(self.letters)}
+
+
+def build_huffman_codes(node: Node, left=True, code='', hashmap=None):
+    """
+    apply the huffman code algorithm, see huffman_code_values
 
     :param node: type Node, consider as the root of our huffman-tree
-    :param left: indicator for left leaf
-    :param code: recursive argument, used for gather the '1' and '0' to establish the right code for each letter
-    :param hashmap: KEEP IT EMPTY, recursive argument, will contain the letter codex
+    :param left: not used, kept for the old recursive signature
+    :param code: prefix for all the codes (the code of node when it is a subtree)
+    :param hashmap: KEEP IT EMPTY, will contain the letter codex (a new one when not given)
     :return: letter hashmap
     """
-    l, r = node.children()
-    if not l and not r:
+    if hashmap is None:
+        hashmap = {}
+    if code and not node.left and not node.right:  # a leaf subtree, its code is the prefix
         hashmap[str(node)] = code
         return hashmap
-    node.set_code(code)
-    if l:
-        build_huffman_codes(node=l, left=True, code=code + "0", hashmap=hashmap)
-    if r:
-        build_huffman_codes(node=r, left=False, code=code + "1", hashmap=hashmap)
+    for letter, (value, length) in huffman_code_values(node).items():
+        hashmap[letter] = code + format(value, '0%db' % length)
     return hashmap
 
 
+def canonical_code_lengths(huffman_code: dict) -> dict:
+    """
+    Code length of every letter. A single letter alphabet still gets a 1 bit code.
+    :param huffman_code: letter hashmap
+    :return: letter - code length hashmap
+    """
+    return {letter: max(len(code), 1) for letter, code in huffman_code.items()}
+
+
+def canonical_codes(code_lengths: dict) -> dict:
+    """
+    Canonical Huffman codes: the letters are sorted by (code length, letter) and get consecutive codes, so the
+    code lengths alone are enough to rebuild the codes on the decompression side.
+    :param code_lengths: letter - code length hashmap
+    :return: letter hashmap
+    """
+    return {letter: format(value, '0%db' % length) for letter, (value, length) in
+            canonical_code_values(code_lengths).items()}
+
+
+def canonical_code_values(code_lengths: dict) -> dict:
+    """
+    Same codes as canonical_codes, as (int value, bit length) pairs
+    :param code_lengths: letter - code length hashmap
+    :return: letter - (code value, code length) hashmap
+    """
+    code_values = {}
+    code = 0
+    prev_length = 0
+    for letter, length in sorted(code_lengths.items(), key=lambda x: (x[1], ord(x[0]))):
+        code <<= length - prev_length
+        code_values[letter] = (code, length)
+        code += 1
+        prev_length = length
+    return code_values
+
+
+def canonical_header(code_lengths: dict) -> str:
+    """
+    Code lengths header: "length:letter.letter...;length:..." with every letter written as its ord() number
+    :param code_lengths: letter - code length hashmap
+    :return: string
+    """
+    letters_by_length = {}
+    for letter, length in code_lengths.items():
+        letters_by_length.setdefault(length, []).append(ord(letter))
+    return ";".join(str(length) + ":" + ".".join(str(letter) for letter in sorted(letters_by_length[length]))
+                    for length in sorted(letters_by_length))
+
+
+def write_canonical_header(code_lengths: dict, file_name: str):
+    """
+    Write the code lengths to file, instead of the inorder and preorder lists.
+    One line: "C|" and then the canonical_header
+    :param code_lengths: letter - code length hashmap
+    :param file_name: string
+    :return:
+    """
+    with open(file_name, "a") as file:
+        file.write(CANONICAL_HEADER_TAG + canonical_header(code_lengths))
+
+
+def length_limited_code_lengths(histogram: dict, max_length: int) -> dict:
+    """
+    Optimal code lengths with no code longer than max_length bits (package-merge).
+    Every letter is a coin of its count, and max_length - 1 times the list is paired into packages and merged
+    back with the letters, sorted by weight. A letter's code length is the number of times it appears in the
+    2n - 2 lightest items of the last list. No tree is built, so there is no recursion however skewed the counts.
+    :param histogram: letter histogram
+    :param max_length: longest code allowed, in bits
+    :return: letter - code length hashmap
+    """
+    letters = sorted(histogram, key=lambda letter: (histogram[letter], letter))  # the rarest first
+    if len(letters) == 1:
+        return {letters[0]: 1}
+    if len(letters) > 1 << max_length:
+        raise Exception(f"{len(letters)} letters do not fit in codes of {max_length} bits")
+    # an item is (weight, letter index) or (weight, (item, item)) for a package
+    leaves = [(histogram[letter], i) for i, letter in enumerate(letters)]
+    items = leaves
+    for _ in range(max_length - 1):
+        packages = [(items[i][0] + items[i + 1][0], (items[i], items[i + 1])) for i in range(0, len(items) - 1, 2)]
+        items = list(heapq.merge(leaves, packages, key=lambda item: item[0]))
+    lengths = [0] * len(letters)
+    stack = items[:2 * len(letters) - 2]
+    while stack:
+        weight, content = stack.pop()
+        if isinstance(content, tuple):
+            stack.extend(content)
+        else:
+            lengths[content] += 1
+    return {letter: lengths[i] for i, letter in enumerate(letters)}
+
+
+def huffman_cost(histogram: dict) -> int:
+    """
+    Encoded size in bits with unlimited Huffman codes: the sum of the counts of all the junctions of the tree
+    (every letter is counted once for every junction above it), without building the tree
+    :param histogram: letter histogram
+    :return: bits
+    """
+    counts = list(histogram.values())
+    if len(counts) == 1:
+        return counts[0]  # a single letter still gets a 1 bit code
+    heapq.heapify(counts)
+    cost = 0
+    while len(counts) > 1:
+        count = heapq.heappop(counts) + heapq.heappop(counts)
+        cost += count
+        heapq.heappush(counts, count)
+    return cost
+
+
+def length_limit_report(histogram: dict, max_length: int) -> str:
+    """
+    :param histogram: letter histogram
+    :param max_length: longest code allowed, in bits
+    :return: the compression cost of limiting the codes, as one line
+    """
+    code_lengths = length_limited_code_lengths(histogram, max_length)
+    letters_amount = sum(histogram.values())
+    limited = sum(count * code_lengths[letter] for letter, count in histogram.items())
+    optimal = huffman_cost(histogram)
+    return f"codes limited to {max_length} bits: {limited / letters_amount:.4f} bits per letter, " \
+           f"unlimited Huffman: {optimal / letters_amount:.4f} ({100 * (limited - optimal) / optimal:.3f}% larger)"
+
+
+def build_canonical_code(histogram: dict, max_code_length=None):
+    """
+    Build the Huffman tree of a histogram (a FlatHuffmanTree) and turn it into canonical codes
+    :param histogram: letter histogram
+    :param max_code_length: longest code allowed in bits (package-merge instead of the tree), default - no limit
+    :return: tuple of letter hashmap and letter - code length hashmap
+    """
+    if max_code_length:
+        code_lengths = length_limited_code_lengths(histogram, max_code_length)
+        return canonical_codes(code_lengths), code_lengths
+    code_lengths = FlatHuffmanTree(sort_histogram(histogram)).code_lengths()
+    return canonical_codes(code_lengths), code_lengths
+
+
+def read_chunks(file_path, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Read a text file chunk by chunk
+    :param file_path: file path
+    :param chunk_size: letters per chunk
+    :return: generator of strings
+    """
+    with open(file_path, "r") as file:
+        chunk = file.read(chunk_size)
+        while chunk:
+            yield chunk
+            chunk = file.read(chunk_size)
+
+
+def stream_histogram(file_path, chunk_size=STREAM_CHUNK_SIZE) -> dict:
+    """
+    First pass of stream mode: letter histogram of a file, counted one chunk at a time
+    :param file_path: file path
+    :param chunk_size: letters per chunk
+    :return: letter histogram
+    """
+    letter_histogram = Counter()
+    for chunk in read_chunks(file_path, chunk_size):
+        letter_histogram.update(filter_abc(chunk))
+    return dict(letter_histogram)
+
+
+def stream_compress(file_path, file_name: str, chunk_size=STREAM_CHUNK_SIZE, max_code_length=None):
+    """
+    Compress a file of any size with memory bounded by the chunk size.
+    First pass counts the histogram, second pass encodes every chunk as its own block.
+    File format: first line is "S|" and the canonical_header, then one line per block, written the same as
+    write_bytes_to_txt_file writes a whole file (placeholder, then the escaped bytes of make_text_bytes), or a
+    stored_block when that is smaller. When the whole file still does not shrink, it is written as a stored file
+    :param file_path: file to compress
+    :param file_name: file name to write to
+    :param chunk_size: letters per chunk
+    :param max_code_length: longest code allowed in bits, default - no limit
+    :return: letter histogram of the file
+    """
+    with profiler.stage("stream_histogram", os.path.getsize(file_path)):
+        histogram = stream_histogram(file_path, chunk_size)
+    if not histogram:
+        return histogram
+    with profiler.stage("build_canonical_code", len(histogram)):
+        huffman_code, code_lengths = build_canonical_code(histogram, max_code_length)
+    with open(file_name, 'w', encoding='utf-8') as new_file:
+        new_file.write(STREAM_HEADER_TAG + canonical_header(code_lengths) + '\n')
+        for chunk in read_chunks(file_path, chunk_size):
+            with profiler.stage("make_text_bytes", len(chunk)) as stage:
+                block = make_text_bytes(chunk, huffman_code)
+                stage.bytes_out = len(block)
+            with profiler.stage("escape_and_write", len(block)):
+                new_file.write(smaller_block(escape_bytes(block), chunk))
+                new_file.write('\n')
+    if os.path.getsize(file_name) > len(STORED_HEADER_TAG) + 1 + os.path.getsize(file_path):
+        write_stored_chunks(file_path, file_name, chunk_size)
+    return histogram
+
+
+def byte_histogram(data: bytes) -> dict:
+    """
+    Byte histogram, with np.bincount when NumPy is installed.
+    Letters are the bytes as latin-1 characters, the same as filter_abc(data.decode('latin-1'))
+    :param data: bytes
+    :return: letter histogram
+    """
+    if np is None:
+        return filter_abc(data.decode('latin-1'))
+    counts = np.bincount(np.frombuffer(data, dtype=np.uint8), minlength=256)
+    return {chr(integer_bits): int(counts[integer_bits]) for integer_bits in np.flatnonzero(counts)}
+
+
+def encode_bytes(data: bytes, huffman_code: dict, chunk_size=1 << 18) -> bytes:
+    """
+    Encode bytes by the huffman code, vectorized with NumPy when it is installed.
+    Gathers the code and the code length of every byte, finds every code's first bit with a cumulative sum of the
+    lengths, and scatters every code into the 32-bit words it falls in (np.bincount sums them, the codes never
+    overlap so the sum is the same as OR). A code that crosses a word boundary is split between the two words.
+    The output is byte-identical to the pure Python BitWriter path (last byte padded with zeros on the right)
+    :param data: bytes
+    :param huffman_code: letter hashmap, letters are latin-1 characters
+    :param chunk_size: bytes encoded at a time, bounds the per-byte arrays
+    :return: encoded bytes
+    """
+    max_len = max(len(code) for code in huffman_code.values())
+    if np is None or max_len > 32:
+        writer = BitWriter()
+        write_text_codes(writer, data.decode('latin-1'), huffman_code)
+        return writer.getvalue()
+
+    codes = np.zeros(256, dtype=np.int64)
+    lengths = np.zeros(256, dtype=np.int64)
+    for letter, code in huffman_code.items():
+        codes[ord(letter)] = int(code, 2)
+        lengths[ord(letter)] = len(code)
+
+    encoded = []
+    carry_word = 0  # the last, not full, word of the previous chunk
+    carry_bits = 0
+    for i in range(0, len(data), chunk_size):
+        symbols = np.frombuffer(data[i: i + chunk_size], dtype=np.uint8)
+        words, carry_word, carry_bits = pack_codes(codes[symbols], lengths[symbols], carry_word, carry_bits)
+        encoded.append(words)
+    if carry_bits:
+        encoded.append(carry_word.to_bytes(4, 'big')[:(carry_bits + 7) // 8])
+    return b''.join(encoded)
+
+
+def pack_codes(chunk_codes, chunk_lengths, carry_word: int, carry_bits: int) -> tuple:
+    """
+    The vectorized step of encode_bytes, see there: pack codes of up to 32 bits into big endian 32-bit words
+    :param chunk_codes: NumPy int64 array of the code values
+    :param chunk_lengths: NumPy int64 array of the code lengths
+    :param carry_word: the last, not full, word of the previous chunk, its bits are the high ones
+    :param carry_bits: bits used in carry_word
+    :return: tuple of the full words as bytes, and the new carry_word and carry_bits
+    """
+    ends = np.cumsum(chunk_lengths) + carry_bits
+    starts = ends - chunk_lengths
+    total_bits = int(ends[-1])
+    word = starts >> 5
+    spill = (starts & 31) + chunk_lengths - 32  # bits that go to the next word
+    split = spill > 0
+    high = np.where(split, chunk_codes >> np.maximum(spill, 0), chunk_codes << np.maximum(-spill, 0))
+    words = np.bincount(word, weights=high, minlength=(total_bits >> 5) + 1)
+    words += np.bincount(word[split] + 1, weights=(chunk_codes[split] << (32 - spill[split])) & 0xFFFFFFFF,
+                         minlength=len(words))
+    words = words.astype(np.uint64)
+    words[0] += carry_word
+    full_words = total_bits >> 5
+    return words[:full_words].astype('>u4').tobytes(), int(words[full_words]), total_bits & 31
+
+
+def write_container(file_name: str, code_lengths: dict, payload: bytes, original_length: int, flags=0,
+                    seek_index=None):
+    """
+    Write the binary container in one pass. Layout (all numbers are big endian):
+    magic (4 bytes) | version (1) | flags (1) | original length in letters (8) |
+    letters amount (4) | per letter: ord(letter) << 8 | code length (4) | payload length (8) | payload |
+    with CONTAINER_FLAG_SEEK_INDEX: seek interval (4) | entries amount (8) | payload bit offset of every entry (8)
+    The payload is the canonical codes of the text, the last byte is padded with zeros on the right
+    (with CONTAINER_FLAG_STORED: the original utf-8 text or bytes, and no letters in the table)
+    :param file_name: file name to write to
+    :param code_lengths: letter - code length hashmap
+    :param payload: encoded bytes
+    :param original_length: letters in the original text
+    :param flags: CONTAINER_FLAG_* bits
+    :param seek_index: tuple of seek interval and bit offsets (output of seek_index), adds CONTAINER_FLAG_SEEK_INDEX
+    :return: None
+    """
+    if seek_index is not None:
+        flags |= CONTAINER_FLAG_SEEK_INDEX
+    with open(file_name, 'wb') as new_file:
+        new_file.write(container_header(code_lengths, len(payload), original_length, flags))
+        new_file.write(payload)
+        if seek_index is not None:
+            interval, bit_offsets = seek_index
+            new_file.write(struct.pack('>IQ', interval, len(bit_offsets)))
+            new_file.write(struct.pack('>%dQ' % len(bit_offsets), *bit_offsets))
+
+
+def container_header(code_lengths: dict, payload_length: int, original_length: int, flags=0) -> bytes:
+    """
+    Everything in the binary container before the payload, see write_container
+    :param code_lengths: letter - code length hashmap
+    :param payload_length: encoded bytes amount
+    :param original_length: letters in the original text
+    :param flags: CONTAINER_FLAG_* bits
+    :return: bytes
+    """
+    table = b''.join(struct.pack('>I', ord(letter) << 8 | length) for letter, length in sorted(code_lengths.items()))
+    return CONTAINER_MAGIC + struct.pack('>BBQI', CONTAINER_VERSION, flags, original_length, len(code_lengths)) + \
+        table + struct.pack('>Q', payload_length)
+
+
+def seek_index(text, code_lengths: dict, interval=SEEK_INTERVAL) -> tuple:
+    """
+    Sparse seek index: the payload bit offset of every interval-th letter. Canonical codes need no decoder
+    state besides the bit offset, so decoding can start at any entry
+    :param text: text (bytes are passed as a latin-1 string)
+    :param code_lengths: letter - code length hashmap
+    :param interval: letters between two entries
+    :return: tuple of the interval and the list of bit offsets (of letters 0, interval, 2 * interval...)
+    """
+    bit_offsets = []
+    bit_offset = 0
+    for i in range(0, len(text), interval):
+        bit_offsets.append(bit_offset)
+        bit_offset += sum(map(code_lengths.__getitem__, text[i: i + interval]))
+    return interval, bit_offsets
+
+
+def seek_index_bytes(data: bytes, code_lengths: dict, interval=SEEK_INTERVAL) -> tuple:
+    """
+    seek_index over bytes, with NumPy when it is installed
+    """
+    if np is None:
+        return seek_index(data.decode('latin-1'), code_lengths, interval)
+    lengths = np.zeros(256, dtype=np.int64)
+    for letter, length in code_lengths.items():
+        lengths[ord(letter)] = length
+    block_bits = [int(lengths[np.frombuffer(data[i: i + interval], dtype=np.uint8)].sum())
+                  for i in range(0, len(data), interval)]
+    return interval, [0] + list(np.cumsum(block_bits[:-1], dtype=np.int64).tolist())
+
+
+def interleaved_payload(streams: list) -> bytes:
+    """
+    Interleaved payload: streams amount (2 bytes) | byte length of every stream (8 each) | the streams.
+    Stream i holds the codes of letters i, i + n, i + 2n... (n streams), each one padded to a byte
+    :param streams: list of coded streams
+    :return: bytes
+    """
+    return struct.pack('>H%dQ' % len(streams), len(streams), *[len(stream) for stream in streams]) + b''.join(streams)
+
+
+def interleave_streams(letters_amount: int) -> int:
+    """
+    Bitstreams amount for --interleave without one: a stream per INTERLEAVE_STREAM_LETTERS letters, at least
+    INTERLEAVE_MIN_STREAMS (so the decoder still runs them in lockstep) and at most INTERLEAVE_STREAMS
+    :param letters_amount: letters in the text (or bytes)
+    :return: int
+    """
+    return max(INTERLEAVE_MIN_STREAMS, min(INTERLEAVE_STREAMS, letters_amount // INTERLEAVE_STREAM_LETTERS))
+
+
+def would_not_shrink(histogram: dict, code_lengths: dict, stored_size: int, interleave=None) -> bool:
+    """
+    Exact check before encoding: would the code table and the encoded letters take at least the stored size
+    :param histogram: letter histogram
+    :param code_lengths: letter - code length hashmap
+    :param stored_size: bytes the data takes stored raw
+    :param interleave: bitstreams amount, each one adds its length and up to a byte of padding
+    :return: bool
+    """
+    overhead = 4 * len(code_lengths) + (2 + 9 * interleave if interleave else 0)
+    return encoded_size(histogram, code_lengths) + overhead >= stored_size
+
+
+def container_compress(text: str, file_name: str, flags=0, max_code_length=None, seek_interval=None,
+                       interleave=None, sample_check=False):
+    """
+    Compress text with canonical codes to a binary container.
+    Text that would not shrink is stored raw (CONTAINER_FLAG_STORED) without encoding it
+    :param text: text (bytes are passed as a latin-1 string with CONTAINER_FLAG_BYTES)
+    :param file_name: file name to write to
+    :param flags: CONTAINER_FLAG_* bits
+    :param max_code_length: longest code allowed in bits, default - no limit
+    :param seek_interval: write a seek index with an entry every that many letters, default - no index
+    :param interleave: split the payload to this many independent bitstreams, default - one bitstream
+    :param sample_check: estimate the entropy from a sample first, and store the text raw without building the
+                         tree when it looks incompressible
+    :return: None
+    """
+    if seek_interval and interleave:
+        raise Exception("a seekable container can not be interleaved")
+    stored = text.encode('latin-1' if flags & CONTAINER_FLAG_BYTES else 'utf-8')
+    if sample_check and looks_incompressible(sample_histogram(text), len(text), len(stored)):
+        write_container(file_name, {}, stored, len(text), flags | CONTAINER_FLAG_STORED)
+        return
+    histogram = filter_abc(text)
+    huffman_code, code_lengths = build_canonical_code(histogram, max_code_length)
+    if would_not_shrink(histogram, code_lengths, len(stored), interleave):
+        write_container(file_name, {}, stored, len(text), flags | CONTAINER_FLAG_STORED)
+        return
+    if interleave:
+        streams = []
+        for i in range(interleave):
+            writer = BitWriter()
+            write_text_codes(writer, text[i::interleave], huffman_code)
+            streams.append(writer.getvalue())
+        write_container(file_name, code_lengths, interleaved_payload(streams), len(text),
+                        flags | CONTAINER_FLAG_INTERLEAVED)
+        return
+    writer = BitWriter()
+    write_text_codes(writer, text, huffman_code)
+    index = seek_index(text, code_lengths, seek_interval) if seek_interval else None
+    write_container(file_name, code_lengths, writer.getvalue(), len(text), flags, index)
+
+
+def container_compress_bytes(data: bytes, file_name: str, max_code_length=None, seek_interval=None, interleave=None,
+                             sample_check=False):
+    """
+    Compress bytes to a binary container, with the NumPy backend when it is installed.
+    Data that would not shrink (already compressed, random) is stored raw (CONTAINER_FLAG_STORED)
+    :param data: bytes
+    :param file_name: file name to write to
+    :param max_code_length: longest code allowed in bits, default - no limit
+    :param seek_interval: write a seek index with an entry every that many bytes, default - no index
+    :param interleave: split the payload to this many independent bitstreams, default - one bitstream
+    :param sample_check: estimate the entropy from a sample first, and store the data raw without the full
+                         histogram when it looks incompressible
+    :return: None
+    """
+    if seek_interval and interleave:
+        raise Exception("a seekable container can not be interleaved")
+    if sample_check and looks_incompressible(sample_histogram(data), len(data), len(data)):
+        write_container(file_name, {}, data, len(data), CONTAINER_FLAG_BYTES | CONTAINER_FLAG_STORED)
+        return
+    histogram = byte_histogram(data)
+    huffman_code, code_lengths = build_canonical_code(histogram, max_code_length)
+    if would_not_shrink(histogram, code_lengths, len(data), interleave):
+        write_container(file_name, {}, data, len(data), CONTAINER_FLAG_BYTES | CONTAINER_FLAG_STORED)
+        return
+    if interleave:
+        streams = [encode_bytes(data[i::interleave], huffman_code) if data[i::interleave] else b''
+                   for i in range(interleave)]
+        write_container(file_name, code_lengths, interleaved_payload(streams), len(data),
+                        CONTAINER_FLAG_BYTES | CONTAINER_FLAG_INTERLEAVED)
+        return
+    index = seek_index_bytes(data, code_lengths, seek_interval) if seek_interval else None
+    write_container(file_name, code_lengths, encode_bytes(data, huffman_code), len(data), CONTAINER_FLAG_BYTES,
+                    index)
+
+
+def read_binary_files(paths):
+    """
+    :param paths: list of file paths
+    :return: generator of the files' bytes, one file at a time
+    """
+    for path in paths:
+        with open(path, 'rb') as file:
+            yield file.read()
+
+
+def train_dictionary(samples, max_code_length=None) -> tuple:
+    """
+    Train a static code table for small messages from sample data.
+    Every byte value gets a count of at least 1, so any message can be compressed with the table,
+    even with bytes that never appeared in the samples
+    :param samples: iterable of bytes
+    :param max_code_length: longest code allowed in bits, default - no limit
+    :return: tuple of dictionary id (crc32 of the table) and letter - code length hashmap
+    """
+    histogram = Counter()
+    for sample in samples:
+        histogram.update(byte_histogram(sample))
+    return histogram_dictionary(histogram, max_code_length)
+
+
+def histogram_dictionary(histogram: dict, max_code_length=None) -> tuple:
+    """
+    Static code table of a byte histogram, see train_dictionary
+    :param histogram: letter histogram of the samples' bytes (latin-1 letters)
+    :param max_code_length: longest code allowed in bits, default - no limit
+    :return: tuple of dictionary id (crc32 of the table) and letter - code length hashmap
+    """
+    histogram = Counter({chr(integer_bits): 1 for integer_bits in range(0, 256)}) + Counter(histogram)
+    huffman_code, code_lengths = build_canonical_code(dict(histogram), max_code_length)
+    return zlib.crc32(dictionary_table(code_lengths)), code_lengths
+
+
+def dictionary_table(code_lengths: dict) -> bytes:
+    """
+    :param code_lengths: letter - code length hashmap over the 256 byte values
+    :return: 256 bytes, the code length of every byte value
+    """
+    return bytes(code_lengths[chr(integer_bits)] for integer_bits in range(0, 256))
+
+
+def write_dictionary(file_name: str, dictionary_id: int, code_lengths: dict):
+    """
+    Write a dictionary file: magic (4 bytes) | version (1) | dictionary id (4) | code length of every byte (256)
+    :param file_name: file name to write to
+    :param dictionary_id: 32 bit id
+    :param code_lengths: letter - code length hashmap over the 256 byte values
+    :return: None
+    """
+    with open(file_name, 'wb') as new_file:
+        new_file.write(DICTIONARY_MAGIC + struct.pack('>BI', DICTIONARY_VERSION, dictionary_id))
+        new_file.write(dictionary_table(code_lengths))
+
+
+def encode_varint(number: int) -> bytes:
+    """
+    LEB128: 7 bits per byte, the high bit is set on every byte but the last
+    """
+    encoded = bytearray()
+    while number > 0x7F:
+        encoded.append(number & 0x7F | 0x80)
+        number >>= 7
+    encoded.append(number)
+    return bytes(encoded)
+
+
+def dictionary_compress(data: bytes, huffman_code: dict, dictionary_id: int) -> bytes:
+    """
+    Compress a message with a pre-trained dictionary. The header only carries the dictionary id:
+    magic (3 bytes) | dictionary id (4) | original length (varint) | payload
+    A payload that would not be shorter than the message is replaced by the message itself, so a payload as long
+    as the original length is the message stored raw (an encoded payload is always shorter)
+    :param data: bytes
+    :param huffman_code: the dictionary's letter hashmap (canonical_codes of its code lengths)
+    :param dictionary_id: 32 bit id
+    :return: compressed message
+    """
+    payload = encode_bytes(data, huffman_code) if data else b''
+    if len(payload) >= len(data):
+        payload = data
+    return DICTIONARY_MESSAGE_MAGIC + struct.pack('>I', dictionary_id) + encode_varint(len(data)) + payload
+
+
+def compress_block(text: str, huffman_code=None, max_code_length=None) -> str:
+    """
+    Compress one independently decodable block, runs in a worker process.
+    Block line: code lengths header of the block ("" if the table is shared), "|", then the escaped bytes, or a
+    stored_block when that is smaller
+    :param text: block text
+    :param huffman_code: shared letter hashmap, default - build a table for this block only
+    :param max_code_length: longest code allowed in bits in the block's own table, default - no limit
+    :return: tuple of the block line, without the line break, and the block's letter histogram (None if the table
+             is shared)
+    """
+    header = ""
+    histogram = None
+    if huffman_code is None:
+        histogram = filter_abc(text)
+        huffman_code, code_lengths = build_canonical_code(histogram, max_code_length)
+        header = canonical_header(code_lengths)
+    return smaller_block(header + "|" + escape_bytes(make_text_bytes(text, huffman_code)), text), histogram
+
+
+def parallel_compress(file_path, file_name: str, chunk_size=STREAM_CHUNK_SIZE, workers=None, shared_table=False,
+                      max_code_length=None):
+    """
+    Compress a file as independent blocks in a process pool.
+    File format: first line is "P|" and the shared canonical_header (empty with a table per block), one line per
+    block (see compress_block), and a last line "I|" with the byte offset of every block line - the block index.
+    When the whole file still does not shrink, it is written as a stored file
+    :param file_path: file to compress
+    :param file_name: file name to write to
+    :param chunk_size: letters per block
+    :param workers: worker processes, default - one per core
+    :param shared_table: one code table for the whole file (an extra histogram pass) instead of a table per block
+    :param max_code_length: longest code allowed in bits, default - no limit
+    :return: letter histogram of the file, merged from the blocks' histograms with a table per block
+    """
+    workers = workers or os.cpu_count() or 1
+    histogram = Counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        huffman_code = None
+        header = ""
+        if shared_table:
+            chunk_histograms = bounded_map(executor, filter_abc, read_chunks(file_path, chunk_size),
+                                           max_pending=2 * workers)
+            for chunk_histogram in chunk_histograms:
+                histogram.update(chunk_histogram)
+            if not histogram:
+                return dict(histogram)
+            huffman_code, code_lengths = build_canonical_code(histogram, max_code_length)
+            header = canonical_header(code_lengths)
+
+        with open(file_name, 'wb') as new_file:
+            new_file.write((PARALLEL_HEADER_TAG + header + '\n').encode('utf-8'))
+            block_index = []
+            for line, block_histogram in bounded_map(executor, compress_block, read_chunks(file_path, chunk_size),
+                                                     huffman_code, max_code_length, max_pending=2 * workers):
+                if block_histogram is not None:
+                    histogram.update(block_histogram)
+                block_index.append(new_file.tell())
+                new_file.write((line + '\n').encode('utf-8'))
+            new_file.write((BLOCK_INDEX_TAG + ",".join(str(offset) for offset in block_index)).encode('utf-8'))
+    if os.path.getsize(file_name) > len(STORED_HEADER_TAG) + 1 + os.path.getsize(file_path):
+        write_stored_chunks(file_path, file_name, chunk_size)
+    return dict(histogram)
+
+
 def zero_padding(text):
     modulo = len(text) % 8
     padding = ""
@@ -270,37 +1311,211 @@ def zero_padding(text):
     return text
 
 
+def file_size(file_path) -> int:
+    """
+    :return: file size in bytes, 0 if the file does not exist
+    """
+    return os.path.getsize(file_path) if os.path.exists(file_path) else 0
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Huffman compression")
+    parser.add_argument("file_name", nargs="?", help="file to compress")
+    parser.add_argument("--canonical", action="store_true",
+                        help="write canonical codes with a code lengths header instead of the tree orders")
+    parser.add_argument("--binary", action="store_true",
+                        help="write a binary container (canonical codes, raw payload) instead of escaped text")
+    parser.add_argument("--bytes", action="store_true",
+                        help="binary container over the file's bytes (any file, not only text), uses NumPy if found")
+    parser.add_argument("--train-dictionary", metavar="DICTIONARY_FILE", default=None,
+                        help="train a dictionary for small messages from file_name (a file or a directory of samples)")
+    parser.add_argument("--dictionary", metavar="DICTIONARY_FILE", default=None,
+                        help="compress file_name's bytes with a pre-trained dictionary")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="one-pass adaptive Huffman over the file's bytes, no header (file_name may be a pipe)")
+    parser.add_argument("--tokens", choices=("words", "ngrams"), default=None,
+                        help="Huffman over a token alphabet (frequent words or n-grams of the file's bytes, "
+                             "rare tokens escaped to bytes) instead of single letters")
+    parser.add_argument("--ngram-size", type=int, default=2, help="bytes per token with --tokens ngrams")
+    parser.add_argument("--seekable", action="store_true",
+                        help="binary and bytes modes: add a seek index, so a range can be read without decoding "
+                             "the whole file (see the decompression script's --range)")
+    parser.add_argument("--seek-interval", type=int, default=SEEK_INTERVAL,
+                        help="letters between two seek index entries")
+    parser.add_argument("--interleave", metavar="STREAMS", type=int, nargs="?", const=0,
+                        default=None, help="binary and bytes modes: deal the letters round-robin to independent "
+                                           "bitstreams, decoded together (64 or more streams use NumPy lockstep). "
+                                           f"Without STREAMS: one per {INTERLEAVE_STREAM_LETTERS} letters, "
+                                           f"{INTERLEAVE_MIN_STREAMS} to {INTERLEAVE_STREAMS}")
+    parser.add_argument("--sample-check", action="store_true",
+                        help="estimate the entropy from a few samples first and store incompressible data raw "
+                             "without building the tree (data that would not shrink is always stored raw)")
+    parser.add_argument("--append", action="store_true",
+                        help="append-only log: compress only the bytes added to file_name since the last run and "
+                             "append them as new blocks (the histogram is kept in a state file next to the output)")
+    parser.add_argument("--drift-threshold", type=float, default=DRIFT_THRESHOLD, metavar="BITS",
+                        help="--append: build a new code table only when the current one loses more than this many "
+                             "bits per byte against the merged histogram's table")
+    parser.add_argument("--stream", action="store_true",
+                        help="compress chunk by chunk with bounded memory, for files larger than RAM")
+    parser.add_argument("--parallel", action="store_true",
+                        help="compress independent blocks in a process pool")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes in parallel mode")
+    parser.add_argument("--shared-table", action="store_true",
+                        help="parallel mode: one code table for all the blocks instead of a table per block")
+    parser.add_argument("--chunk-size", type=int, default=STREAM_CHUNK_SIZE,
+                        help="letters per chunk in stream and parallel modes")
+    parser.add_argument("--max-code-length", type=int, default=None, metavar="BITS",
+                        help="limit the codes to this many bits (package-merge) and print the compression cost, "
+                             "bounds the decoder tables. Implies --canonical in the default text mode")
+    parser.add_argument("--profile", action="store_true",
+                        help="report time and bytes per stage (same as the HUFFMAN_PROFILE environment variable)")
+    parser.add_argument("--profile-options", metavar="OPTIONS", default=None,
+                        help="comma separated stages, tracemalloc, cprofile, implies --profile (default - stages)")
+    parser.add_argument("--profile-output", metavar="FILE", default=None,
+                        help="write the profile report to FILE instead of stderr")
+    return parser.parse_args()
+
+
 def main():
     output_file = "ID1_ID2_compressed.txt"
 
     try:
-        if (len(sys.argv)) > 1:
-            file_name = sys.argv[1]
-            if os.path.exists(file_name):
+        args = parse_arguments()
+        if args.profile or args.profile_options:
+            profiler.configure(args.profile_options or "stages", args.profile_output)
+        if args.file_name:
+            file_name = args.file_name
+            if os.path.exists(file_name) and args.train_dictionary:
+                samples_paths = [file_name]
+                if os.path.isdir(file_name):
+                    samples_paths = [os.path.join(file_name, name) for name in sorted(os.listdir(file_name))
+                                     if os.path.isfile(os.path.join(file_name, name))]
+                dictionary_id, code_lengths = train_dictionary(read_binary_files(samples_paths), args.max_code_length)
+                write_dictionary(args.train_dictionary, dictionary_id, code_lengths)
+                print(f"dictionary id: {dictionary_id:08x}")
+            elif os.path.exists(file_name) and args.dictionary:
+                dictionary_id, code_lengths = read_dictionary(args.dictionary)
+                with open(file_name, 'rb') as file:
+                    data = file.read()
+                with profiler.stage("dictionary_compress", len(data)) as stage, open(output_file, 'wb') as new_file:
+                    stage.bytes_out = new_file.write(dictionary_compress(data, canonical_codes(code_lengths),
+                                                                         dictionary_id))
+            elif os.path.exists(file_name) and args.adaptive:
+                from adaptive_huffman import adaptive_compress
+                with profiler.stage("adaptive_compress", file_size(file_name)) as stage:
+                    adaptive_compress(file_name, output_file)
+                    stage.bytes_out = file_size(output_file)
+            elif os.path.exists(file_name) and args.tokens:
+                from token_huffman import token_compress
+                with profiler.stage("token_compress", file_size(file_name)) as stage:
+                    token_compress(file_name, output_file, tokenizer=args.tokens, ngram_size=args.ngram_size,
+                                   max_code_length=args.max_code_length)
+                    stage.bytes_out = file_size(output_file)
+            elif os.path.exists(file_name) and args.append:
+                from log_huffman import log_append
+                with profiler.stage("log_append", file_size(file_name)) as stage:
+                    appended, blocks, drift = log_append(file_name, output_file, chunk_size=args.chunk_size,
+                                                         drift_threshold=args.drift_threshold,
+                                                         max_code_length=args.max_code_length)
+                    stage.bytes_out = file_size(output_file)
+                table = "new code table" if drift is None else f"code table reused, drift {drift:.4f} bits per byte"
+                print(f"appended {appended} bytes in {blocks} blocks, {table}")
+            elif os.path.exists(file_name) and args.parallel:
+                with profiler.stage("parallel_compress", file_size(file_name)) as stage:
+                    histogram = parallel_compress(file_name, output_file, chunk_size=args.chunk_size,
+                                                  workers=args.workers, shared_table=args.shared_table,
+                                                  max_code_length=args.max_code_length)
+                    stage.bytes_out = file_size(output_file)
+                if args.max_code_length and histogram:
+                    print(length_limit_report(histogram, args.max_code_length))
+            elif os.path.exists(file_name) and args.bytes:
+                with open(file_name, 'rb') as file:
+                    data = file.read()
+                if data:
+                    interleave = interleave_streams(len(data)) if args.interleave == 0 else args.interleave
+                    with profiler.stage("container_compress_bytes", len(data)) as stage:
+                        container_compress_bytes(data, output_file, args.max_code_length,
+                                                 args.seek_interval if args.seekable else None, interleave,
+                                                 args.sample_check)
+                        stage.bytes_out = file_size(output_file)
+                    if args.max_code_length:
+                        print(length_limit_report(byte_histogram(data), args.max_code_length))
+            elif os.path.exists(file_name) and args.stream:
+                histogram = stream_compress(file_name, output_file, chunk_size=args.chunk_size,
+                                            max_code_length=args.max_code_length)
+                if args.max_code_length and histogram:
+                    print(length_limit_report(histogram, args.max_code_length))
+            elif os.path.exists(file_name):
                 file_directory = os.getcwd()
-                file_path = file_directory + '/' + file_name
-                text = read_file(file_path)
-                if text:
-                    text_histogram = filter_abc(text)
-                    text_histogram = sorted(text_histogram.items(), key=lambda x: x[1], reverse=True)
+                file_path = os.path.join(file_directory, file_name)
+                with profiler.stage("read_file", file_size(file_path)):
+                    text = read_file(file_path)
+                stored_size = len(STORED_HEADER_TAG) + 1 + len(text.encode('utf-8')) if text else 0
+                text_histogram = filter_abc(text) if text and args.max_code_length else None
+                if text_histogram:
+                    print(length_limit_report(text_histogram, args.max_code_length))
+                if text and args.binary:
+                    interleave = interleave_streams(len(text)) if args.interleave == 0 else args.interleave
+                    with profiler.stage("container_compress", len(text)) as stage:
+                        container_compress(text, output_file, max_code_length=args.max_code_length,
+                                           seek_interval=args.seek_interval if args.seekable else None,
+                                           interleave=interleave, sample_check=args.sample_check)
+                        stage.bytes_out = file_size(output_file)
+                elif text and args.sample_check and looks_incompressible(sample_histogram(text), len(text),
+                                                                         stored_size):
+                    write_stored_file(text, output_file)
+                elif text and args.max_code_length:
+                    huffman_code, code_lengths = build_canonical_code(text_histogram, args.max_code_length)
+                    if would_not_shrink(text_histogram, code_lengths, stored_size):
+                        write_stored_file(text, output_file)
+                    else:
+                        write_bytes_to_txt_file(data=make_text_bytes(text, huffman_code), file_name=output_file)
+                        write_canonical_header(code_lengths, file_name=output_file)
+                elif text:
+                    with profiler.stage("filter_abc", len(text)):
+                        text_histogram = filter_abc(text)
+                        text_histogram = sort_histogram(text_histogram)
                     unique_value = len(text_histogram)
                     # there is no meaning for the number itself as long that every junction has a unique number
 
-                    nodes_list = [(Node(letters=key, count=val), val) for key, val in text_histogram]
-
-                    root = create_huffman_tree(nodes_list, unique_value)
-                    huffman_code = build_huffman_codes(root)
+                    with profiler.stage("build_huffman_tree", unique_value):
+                        nodes_list = [(Node(letters=key, count=val), val) for key, val in text_histogram]
+                        root = build_huffman_tree(nodes_list, unique_value)
+                    with profiler.stage("build_huffman_codes", unique_value):
+                        huffman_code = build_huffman_codes(root)
                     # # ~~~~~~~~~~~~~~ PRINTING Huffman Codes ~~~~~~~~~~~~~~~#
                     # print(' Char | Huffman code      | Count ')
                     # for letter, val in text_histogram:
                     #     print(' %-4r |%16s   |%s' % (letter, huffman_code[letter], val))
 
-                    inorder = inorder_interval(root)
-                    preorder = preorder_interval(root)
-                    binary_huffman_text = make_text_binary(text, huffman_code)
-                    binary_huffman_text = zero_padding(binary_huffman_text)  # second byte = padding amount
-                    write_to_txt_file(text=binary_huffman_text, file_name=output_file)  # first byte = place holder
-                    write_orders_to_file(inorder=inorder, preorder=preorder, file_name=output_file)
+                    if would_not_shrink(dict(text_histogram), {letter: len(code) for letter, code in
+                                                               huffman_code.items()}, stored_size):
+                        write_stored_file(text, output_file)
+                    elif args.canonical:
+                        code_lengths = canonical_code_lengths(huffman_code)
+                        huffman_code = canonical_codes(code_lengths)
+                        with profiler.stage("make_text_bytes", len(text)) as stage:
+                            huffman_bytes = make_text_bytes(text, huffman_code, text_histogram)
+                            stage.bytes_out = len(huffman_bytes)
+                        with profiler.stage("write_to_txt_file", len(huffman_bytes)) as stage:
+                            write_bytes_to_txt_file(data=huffman_bytes, file_name=output_file)
+                            write_canonical_header(code_lengths, file_name=output_file)
+                            stage.bytes_out = file_size(output_file)
+                    else:
+                        with profiler.stage("tree_orders", unique_value):
+                            inorder = [order_entry(node) for node in inorder_nodes(root)]
+                            preorder = [order_entry(node) for node in preorder_nodes(root)]
+                        with profiler.stage("make_text_bytes", len(text)) as stage:
+                            huffman_bytes = make_text_bytes(text, huffman_code, text_histogram)  # first byte = padding
+                            stage.bytes_out = len(huffman_bytes)
+                        with profiler.stage("write_to_txt_file", len(huffman_bytes)) as stage:
+                            # first byte = placeholder
+                            write_bytes_to_txt_file(data=huffman_bytes, file_name=output_file)
+                            write_orders_to_file(inorder=inorder, preorder=preorder, file_name=output_file)
+                            stage.bytes_out = file_size(output_file)
+                if text and not args.binary and file_size(output_file) > stored_size:
+                    write_stored_file(text, output_file)  # the header and the escaping made it larger than the text
 
             else:
                 print(f"Did not found file name {file_name}. Exiting...")
@@ -310,6 +1525,7 @@ def main():
             print("No file has been chosen! Exiting...")
             sleep(2)
             exit(-1)
+        profiler.finish()
 
     except Exception as e:
         frame = inspect.trace()[-1]
@@ -1,10 +1,51 @@
+import re
 import sys
+import mmap
 from time import sleep
 import os
+import struct
 import inspect
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, interleaved payloads are then decoded one stream at a time
+    np = None
+
+from huffman_profiling import profiler
+
+DECODE_FLUSH_LETTERS = 1 << 16  # letters kept before writing them out, when decoding straight to an output
+PRIMARY_TABLE_BITS = 10  # bits looked up at once by the table decoder, longer codes go to the overflow subtables
+ORDER_HEADER_TAG = "O|"  # tree order lines tag, older files have the letters themselves in the order lines
+CANONICAL_HEADER_TAG = "C|"  # last line tag of a file compressed with canonical codes
+STREAM_HEADER_TAG = "S|"  # first line tag of a file compressed in stream mode
+STORED_HEADER_TAG = "R|"  # first line tag of a text file stored raw
+PARALLEL_HEADER_TAG = "P|"  # first line tag of a file compressed in parallel blocks mode
+BLOCK_INDEX_TAG = "I|"  # last line tag of a file compressed in parallel blocks mode
+CONTAINER_MAGIC = b'\x89HUF'  # first bytes of a binary container
+CONTAINER_VERSION = 1
+CONTAINER_FLAG_BYTES = 1  # the original data is bytes (letters are byte values), not text
+CONTAINER_FLAG_SEEK_INDEX = 2  # a seek index follows the payload
+CONTAINER_FLAG_INTERLEAVED = 4  # the payload is several bitstreams, the letters are dealt to them round-robin
+CONTAINER_FLAG_STORED = 8  # the payload is the original data as it is (utf-8 text, or bytes)
+UTF8_CONTINUATION_BYTES = bytes(range(0x80, 0xC0))  # the bytes that do not start a utf-8 letter
+STORED_SCAN_BYTES = 1 << 16  # bytes counted at a time when looking for a letter in a stored utf-8 payload
+MAX_CODE_LENGTH = 64  # longest code accepted from a container, bounds the subtable levels a letter can take
+LOCKSTEP_MIN_STREAMS = 64  # fewer interleaved streams are decoded one at a time, NumPy's per-step cost is too high
+LOCKSTEP_MAX_CODE_LENGTH = 16  # longest code for the NumPy lockstep decoder, its table has 2 ** length entries
+DICTIONARY_MAGIC = b'\x89HUD'  # pre-trained code table file
+DICTIONARY_VERSION = 1
+DICTIONARY_MESSAGE_MAGIC = b'\x89HM'  # first bytes of a message compressed with a pre-trained dictionary
+ADAPTIVE_MAGIC = b'\x89HUA'  # first bytes of a file compressed in adaptive mode
+TOKEN_MAGIC = b'\x89HUT'  # first bytes of a file compressed over a token alphabet
+LOG_MAGIC = b'\x89HUL'  # first bytes of an append-only log archive
 
 
 class Node:
+    __slots__ = ("left", "right", "letters", "node_count", "code", "unique_value")
+
     def __init__(self, left=None, right=None, letters=None, count=None, code="", unique_value=0):
         self.left = left
         self.right = right
@@ -65,7 +106,11 @@ def read_file(file_path):
 
 def extract_order(text):
     """
-    Extract from the end of the file the order of the tree.
+    Extract from the end of the file the order of the tree, in one pass.
+    An "O|" line has unambiguous entries: a letter is its ord() number and a junction is "*" and its unique value,
+    junctions are returned as int and letters as str. Older files have the letters themselves ("\\n" for a line
+    break, a comma letter between two separators) and the junction numbers, so a digit letter is mistaken for a
+    junction there.
 
     NOTE:
     -----
@@ -73,23 +118,24 @@ def extract_order(text):
     :param text: string with a list at the end of file's data
     :return: tuple of list and the new text without the list
     """
-    idx = len(text) - 1
-    placeholder = text[idx]
-    while placeholder != '\n':
-        idx -= 1
-        placeholder = text[idx]
-    order_list = []
+    idx = text.rfind('\n')
     new_text = text[:idx]
-    order = text[idx + 1:len(text)]
+    order = text[idx + 1:]
+    if order.startswith(ORDER_HEADER_TAG):
+        return [int(entry[1:]) if entry[0] == '*' else chr(int(entry))
+                for entry in order[len(ORDER_HEADER_TAG):].split(',')], new_text
+
+    order_list = []
     long_string = ''
-    while order:
-        temp_letter = order[0]
-        order = order[1:]
-        if temp_letter == ',' and order[0] == ',':
+    i = 0
+    while i < len(order):
+        temp_letter = order[i]
+        i += 1
+        if temp_letter == ',' and order[i] == ',':
             order_list.append(long_string)
             long_string = ''
             order_list.append(temp_letter)
-            order = order[2:]
+            i += 2
             continue
 
         if temp_letter != ',':
@@ -101,7 +147,88 @@ def extract_order(text):
             long_string = ''
 
     order_list.append(long_string)
-    return order_list, new_text
+    return [legacy_order_entry(entry) for entry in order_list], new_text
+
+
+def legacy_order_entry(entry: str):
+    """
+    :return: a junction's unique value as int (any entry that is a number), a letter as it is
+    """
+    try:
+        return int(entry)
+    except ValueError:
+        return entry
+
+
+def has_canonical_header(text) -> bool:
+    """
+    Check if the file was compressed with canonical codes (its last line is a code lengths header)
+    :param text: compressed file's text
+    :return: bool
+    """
+    return text[text.rfind('\n') + 1:].startswith(CANONICAL_HEADER_TAG)
+
+
+def extract_canonical_header(text):
+    """
+    Extract the code lengths header from the end of the file, in one pass.
+    The header is "C|length:letter.letter...;length:..." with every letter written as its ord() number
+    :param text: string with a code lengths header at the end of file's data
+    :return: tuple of letter - code length hashmap and the new text without the header
+    """
+    idx = text.rfind('\n')
+    return parse_canonical_header(text[idx + 1 + len(CANONICAL_HEADER_TAG):]), text[:idx]
+
+
+def parse_canonical_header(header: str) -> dict:
+    """
+    Parse a "length:letter.letter...;length:..." code lengths header
+    :param header: string
+    :return: letter - code length hashmap
+    """
+    code_lengths = {}
+    for group in header.split(';'):
+        length, letters = group.split(':')
+        for letter in letters.split('.'):
+            code_lengths[chr(int(letter))] = int(length)
+    validate_code_lengths(code_lengths)
+    return code_lengths
+
+
+def validate_code_lengths(code_lengths: dict):
+    """
+    Check code lengths read from a file before building tables from them: every length is 1 to MAX_CODE_LENGTH and
+    the lengths make a complete prefix code (Kraft sum of exactly 1), as every Huffman code is, or a single 1 bit
+    code for a one letter alphabet
+    :param code_lengths: letter - code length hashmap
+    :return: None, raises an exception on invalid lengths
+    """
+    if not code_lengths:
+        return
+    if min(code_lengths.values()) < 1 or max(code_lengths.values()) > MAX_CODE_LENGTH:
+        raise Exception(f"invalid code lengths, every length must be 1 to {MAX_CODE_LENGTH} bits")
+    kraft_sum = sum(1 << (MAX_CODE_LENGTH - length) for length in code_lengths.values())
+    if len(code_lengths) == 1 and kraft_sum == 1 << (MAX_CODE_LENGTH - 1):
+        return
+    if kraft_sum != 1 << MAX_CODE_LENGTH:
+        raise Exception("invalid code lengths, they are not a complete prefix code")
+
+
+def canonical_decode_hash(code_lengths: dict) -> dict:
+    """
+    Canonical Huffman codes: the letters are sorted by (code length, letter) and get consecutive codes
+    :param code_lengths: letter - code length hashmap
+    :return: binary hashmap, key-value pairs of binary_sequence-letter
+    """
+    huffman_hash = {}
+    code = 0
+    prev_length = 0
+    for letter, length in sorted(code_lengths.items(), key=lambda x: (x[1], ord(x[0]))):
+        code <<= length - prev_length
+        huffman_hash[format(code, '0%db' % length)] = letter
+        code += 1
+        prev_length = length
+    return huffman_hash
 
 
 def search(arr, start, end, value):
@@ -118,81 +245,124 @@ def search(arr, start, end, value):
             return i
 
 
-def buildTree(inorder, preorder, in_start, in_end, pre_index=0):
+def buildTree(inorder, preorder, in_start, in_end, pre_index=0, positions=None):
     """
-    Recursive function to build a binary tree from preorder and inorder traversals
+    Build a binary tree from preorder and inorder traversals, with an explicit stack (no recursion limit on deep trees)
     :param inorder: inorder traversal list
     :param preorder: preorder traversal list
     :param in_start: index to start
     :param in_end: index to stop
     :param pre_index: DO NOT ENTER A VALUE!
+    :param positions: inorder value - index hashmap, built here if not given
     :return: Binary tree of Nodes
     """
     if in_start > in_end:
         return None, pre_index
+    if positions is None:
+        positions = {}
+        for idx, value in enumerate(inorder):
+            positions.setdefault(value, idx)
 
-    # Pick current node from preorder traversal using
-    # preIndex and increment preIndex
-    info = preorder[pre_index]
-    try:
-        node = Node(unique_value=int(info))
-        node.letters = "1234567890"
-    except ValueError:
-        node = Node(letters=info)
-    pre_index += 1
+    root = None
+    # every task is an inorder range to build and where to put its subtree root.
+    # The left subtree is pushed last, so it takes the next preorder values before the right one
+    stack = [(in_start, in_end, None, True)]
+    while stack:
+        in_start, in_end, parent, left_child = stack.pop()
+        if in_start > in_end:
+            continue
+
+        # Pick current node from preorder traversal using
+        # preIndex and increment preIndex
+        info = preorder[pre_index]
+        if isinstance(info, int):
+            node = Node(letters="", unique_value=info)
+        else:
+            node = Node(letters=info)
+        pre_index += 1
+        if parent is None:
+            root = node
+        else:
+            parent.set_child(left_child, node)
 
-    # If this node has no children then return
-    if in_start == in_end:
-        return node, pre_index
+        # If this node has no children then continue
+        if in_start == in_end:
+            continue
 
-    # Else find the index of this node in inorder traversal
-    in_index = search(arr=inorder, start=in_start, end=in_end, value=info)
+        # Else find the index of this node in inorder traversal
+        in_index = positions.get(info)
+        if in_index is None or not in_start <= in_index <= in_end:
+            in_index = search(arr=inorder, start=in_start, end=in_end, value=info)
+        stack.append((in_index + 1, in_end, node, False))
+        stack.append((in_start, in_index - 1, node, True))
 
-    # Using index in inorder Traversal, construct left 
-    # and right subtrees
-    node.left, pre_index = buildTree(inorder=inorder, preorder=preorder, in_start=in_start, in_end=in_index - 1, pre_index=pre_index)
-    node.right, pre_index = buildTree(inorder=inorder, preorder=preorder, in_start=in_index + 1, in_end=in_end, pre_index=pre_index)
+    return root, pre_index
 
-    return node, pre_index
+
+def huffman_code_values(root: Node) -> dict:
+    """
+    Codes of all the tree's leaves as (int value, bit length) pairs, walking the tree with an explicit stack
+    :param root: type Node, consider as the root of our huffman-tree
+    :return: letter - (code value, code length) hashmap
+    """
+    code_values = {}
+    stack = [(root, 0, 0)]
+    while stack:
+        node, value, length = stack.pop()
+        l, r = node.children()
+        if not l and not r:
+            code_values[str(node)] = (value, length or 1)  # a lone root leaf (one letter alphabet) gets the code 0
+            continue
+        if r:
+            stack.append((r, value << 1 | 1, length + 1))
+        if l:
+            stack.append((l, value << 1, length + 1))
+    return code_values
 
 
-def build_huffman_codes(node: Node, left=True, code='', hashmap={}):
+def build_huffman_codes(node: Node, left=True, code='', hashmap=None):
     """
-    recursive function that apply the huffman code algorithm
+    apply the huffman code algorithm, see huffman_code_values
 
     :param node: type Node, consider as the root of our huffman-tree
-    :param left: indicator for left leaf
-    :param code: recursive argument, used for gather the '1' and '0' to establish the right code for each letter
-    :param hashmap: KEEP IT EMPTY, recursive argument, will contain the letter codex
+    :param left: not used, kept for the old recursive signature
+    :param code: prefix for all the codes (the code of node when it is a subtree)
+    :param hashmap: KEEP IT EMPTY, will contain the letter codex (a new one when not given)
     :return: binary hashmap
     """
-    l, r = node.children()
-    if not l and not r:
-        hashmap[str(code)] = str(node)
+    if hashmap is None:
+        hashmap = {}
+    if code and not node.left and not node.right:  # a leaf subtree, its code is the prefix
+        hashmap[code] = str(node)
         return hashmap
-    node.set_code(code)
-    if l:
-        build_huffman_codes(node=l, left=True, code=code + "0", hashmap=hashmap)
-    if r:
-        build_huffman_codes(node=r, left=False, code=code + "1", hashmap=hashmap)
+    for letter, (value, length) in huffman_code_values(node).items():
+        hashmap[code + format(value, '0%db' % length)] = letter
     return hashmap
 
 
-def inorder_interval(root: Node, inorder_list=[]):
+def inorder_interval(root: Node, inorder_list=None):
     """
-    Inorder interval on a tree: left --> root --> right
+    Inorder interval on a tree: left --> root --> right, with an explicit stack (no recursion limit on deep trees)
     :param root: Node type
     :param inorder_list: List - KEEP IT EMPTY unless you want to add the tree from the root param to a list of your own
     :return: complete inorder list
     """
+    if inorder_list is None:
+        inorder_list = []
     if not root:
         return
-    inorder_interval(root.left)
-    if len(root.get_letters()) == 1:
-        inorder_list.append(root.get_letters())
-    else:
-        inorder_list.append(str(root.get_unique_value()))
-    inorder_interval(root.right)
+    stack = []
+    node = root
+    while stack or node:
+        while node:
+            stack.append(node)
+            node = node.left
+        node = stack.pop()
+        if len(node.get_letters()) == 1:
+            inorder_list.append(node.get_letters())
+        else:
+            inorder_list.append(str(node.get_unique_value()))
+        node = node.right
 
     return inorder_list
 
@@ -278,37 +448,791 @@ def huffman_decoder(original_binary: str, huffman_hash: dict):
     return original_text
 
 
-def text_decoding(text, huffman_histogram: dict):
+def text_to_bytes(text, placeholder) -> bytes:
+    """
+    Same as text_to_binary, but returns the coded bytes themselves instead of a binary string
+    :param text: compressed text by Huffman code
+    :param placeholder: Place-holder for unprintable chars
+    :return: bytes
+    """
+    def unescape(match):
+        if match.group(1) == placeholder:
+            return chr(127)
+        return chr(64 - ord(match.group(1)))
+
+    return re.sub(re.escape(placeholder) + '(.)', unescape, text, flags=re.DOTALL).encode('latin-1')
+
+
+def build_decode_table(huffman_hash: dict, primary_bits=PRIMARY_TABLE_BITS):
+    """
+    Build lookup tables for huffman_table_decoder.
+    The primary table is indexed by the next `primary_bits` bits of the stream. Every code up to `primary_bits` long
+    fills all the entries that start with it. Longer codes go to a subtable per primary prefix, indexed by the bits
+    that follow that prefix, up to `primary_bits` of them, and codes longer than that go on to a next level
+    subtable, so no table has more than 2 ** primary_bits entries however long the codes are.
+    Entry lengths are the code lengths, a negative length -n marks a subtable indexed by the next n bits, and the
+    entry letter is then the subtable number.
+    :param huffman_hash: Huffman code hashmap, key-value pairs of binary_sequence-letter
+    :param primary_bits: bits looked up in the primary table and at most in every subtable
+    :return: tuple of (primary_bits, letters, lengths, subtables), subtables is a list of (sub_bits, letters, lengths)
+    """
+    max_len = max(len(code) for code in huffman_hash)
+    subtables = []
+    letters, lengths = fill_decode_table([(code, letter, len(code)) for code, letter in huffman_hash.items()],
+                                         min(primary_bits, max_len), primary_bits, subtables)
+    return min(primary_bits, max_len), letters, lengths, subtables
+
+
+def fill_decode_table(codes: list, table_bits: int, level_bits: int, subtables: list) -> tuple:
+    """
+    One level of build_decode_table
+    :param codes: list of (the code bits left for this level and the next ones, letter, whole code length)
+    :param table_bits: bits this table is indexed by
+    :param level_bits: bits a subtable is indexed by at most
+    :param subtables: list the subtables are added to
+    :return: tuple of the table's letters and lengths
+    """
+    letters = [None] * (1 << table_bits)
+    lengths = [0] * (1 << table_bits)
+    long_codes = {}
+    for code, letter, code_length in codes:
+        if len(code) <= table_bits:
+            shift = table_bits - len(code)
+            start = int(code, 2) << shift if code else 0
+            for idx in range(start, start + (1 << shift)):
+                letters[idx] = letter
+                lengths[idx] = code_length
+        else:
+            long_codes.setdefault(int(code[:table_bits], 2), []).append((code[table_bits:], letter, code_length))
+
+    for prefix, suffixes in long_codes.items():
+        sub_bits = min(max(len(suffix) for suffix, letter, code_length in suffixes), level_bits)
+        subtable = len(subtables)
+        subtables.append(None)  # the number is taken before the deeper levels add theirs
+        sub_letters, sub_lengths = fill_decode_table(suffixes, sub_bits, level_bits, subtables)
+        subtables[subtable] = (sub_bits, sub_letters, sub_lengths)
+        letters[prefix] = subtable
+        lengths[prefix] = -sub_bits
+    return letters, lengths
+
+
+def huffman_table_decoder(data: bytes, decode_table, bit_offset=0, bit_length=None, letters_amount=None,
+                          write=None):
+    """
+    Decode Huffman coded bytes with the lookup tables of build_decode_table.
+    Every letter costs one lookup in the primary table (plus one per subtable level for the long codes) instead of
+    growing a prefix bit by bit.
+    `data` is only read by 8 bytes slices, so it can be a memoryview of an mmap, nothing is copied.
+    :param data: coded bytes (bytes, bytearray, memoryview or mmap)
+    :param decode_table: output of build_decode_table
+    :param bit_offset: first bit of the coded data in `data`
+    :param bit_length: amount of coded bits, default - up to the end of `data`
+    :param letters_amount: stop after decoding that many letters, default - decode all the coded bits
+    :param write: decode straight to an output, called with every DECODE_FLUSH_LETTERS decoded letters
+    :return: original text ('' when `write` is given)
+    """
+    primary_bits, letters, lengths, subtables = decode_table
+    max_len = max([primary_bits] + [max(sub_lengths) for sub_bits, sub_letters, sub_lengths in subtables])
+    if bit_length is None:
+        bit_length = len(data) * 8 - bit_offset
+    if letters_amount is None:
+        letters_amount = -1
+    if bit_length <= 0 or not letters_amount:
+        return ''
+    pos = bit_offset // 8 + 1
+    nbits = 8 - bit_offset % 8
+    acc = data[pos - 1] & ((1 << nbits) - 1)
+    primary_mask = (1 << primary_bits) - 1
+    original_text = []
+    decoded = 0
+    consumed = 0
+    while consumed < bit_length and letters_amount != decoded:
+        while nbits < max_len:  # codes may be longer than one refill
+            chunk = data[pos:pos + 8]
+            acc = (acc << 64) | (int.from_bytes(chunk, 'big') << (64 - 8 * len(chunk)))  # zeros past the end
+            pos += 8
+            nbits += 64
+        idx = (acc >> (nbits - primary_bits)) & primary_mask
+        length = lengths[idx]
+        letter = letters[idx]
+        used = primary_bits
+        while length < 0:  # a long code, look the next bits up in the subtable
+            sub_bits, sub_letters, sub_lengths = subtables[letter]
+            used += sub_bits
+            idx = (acc >> (nbits - used)) & ((1 << sub_bits) - 1)
+            letter = sub_letters[idx]
+            length = sub_lengths[idx]
+        nbits -= length
+        acc &= (1 << nbits) - 1
+        consumed += length
+        original_text.append(letter)
+        decoded += 1
+        if write is not None and len(original_text) == DECODE_FLUSH_LETTERS:
+            write(''.join(original_text))
+            original_text = []
+    if write is not None:
+        write(''.join(original_text))
+        return ''
+    return ''.join(original_text)
+
+
+def stored_block_text(line) -> str:
+    """
+    Text of a block stored raw: STORED_HEADER_TAG, the length of the text in letters, "|", then the text
+    :param line: block line
+    :return: Original text
+    """
+    length, text = line[len(STORED_HEADER_TAG):].split('|', 1)
+    if len(text) < int(length):
+        raise Exception("stored block is shorter than its length!")
+    return text[:int(length)]
+
+
+def decode_block(text, decode_table):
+    """
+    Decode one escaped block: placeholder, then the escaped bytes, the first one is the padding amount.
+    A block stored raw (it starts with STORED_HEADER_TAG, a placeholder is never followed by "|") is returned as it is
+    :param text: string
+    :param decode_table: output of build_decode_table
+    :return: Original text
+    """
+    if text.startswith(STORED_HEADER_TAG):
+        return stored_block_text(text)
+    coded_bytes = text_to_bytes(text[1:], placeholder=text[0])
+    zeros_amount = int(chr(coded_bytes[0]))
+    return huffman_table_decoder(coded_bytes, decode_table, bit_offset=zeros_amount + 8)
+
+
+def starts_with_tag(file_path, tag) -> bool:
+    """
+    Check if the file starts with a mode tag
+    :param file_path: file path
+    :param tag: string
+    :return: bool
+    """
+    return starts_with_bytes(file_path, tag.encode('utf-8'))
+
+
+def starts_with_bytes(file_path, magic: bytes) -> bool:
+    """
+    Check if the file starts with a magic number
+    :param file_path: file path
+    :param magic: bytes
+    :return: bool
+    """
+    with open(file_path, "rb") as file:
+        return file.read(len(magic)) == magic
+
+
+def is_stream_file(file_path) -> bool:
+    """
+    Check if the file was compressed in stream mode
+    :param file_path: file path
+    :return: bool
+    """
+    return starts_with_tag(file_path, STREAM_HEADER_TAG)
+
+
+def is_parallel_file(file_path) -> bool:
+    """
+    Check if the file was compressed in parallel blocks mode
+    :param file_path: file path
+    :return: bool
+    """
+    return starts_with_tag(file_path, PARALLEL_HEADER_TAG)
+
+
+def is_stored_file(file_path) -> bool:
+    """
+    Check if the file is a text file stored raw (it would not shrink)
+    :param file_path: file path
+    :return: bool
+    """
+    return starts_with_tag(file_path, STORED_HEADER_TAG + '\n')
+
+
+def stored_decompress(file_path, file_name: str, chunk_size=1 << 20):
+    """
+    Copy the text of a stored file, after its tag line, chunk by chunk
+    :param file_path: file path
+    :param file_name: file name to write to
+    :param chunk_size: bytes copied at a time
+    :return: None
+    """
+    with open(file_path, 'rb') as file, open(file_name, 'wb') as new_file:
+        file.readline()
+        chunk = file.read(chunk_size)
+        while chunk:
+            new_file.write(chunk)
+            chunk = file.read(chunk_size)
+
+
+def stream_decoding(file_path):
+    """
+    Decode a file compressed in stream mode, one block at a time, so memory is bounded by the block size
+    :param file_path: file path
+    :return: generator of the original text, block by block
+    """
+    with open(file_path, "r", encoding='utf-8') as file:
+        header = file.readline().rstrip('\n')
+        code_lengths = parse_canonical_header(header[len(STREAM_HEADER_TAG):])
+        decode_table = build_decode_table(canonical_decode_hash(code_lengths))
+        line = file.readline()
+        while line:
+            if line.startswith(STORED_HEADER_TAG):  # the stored text may hold line breaks, read the rest of it
+                length_end = line.index('|', len(STORED_HEADER_TAG)) + 1
+                missing = length_end + int(line[len(STORED_HEADER_TAG):length_end - 1]) + 1 - len(line)
+                if missing > 0:
+                    line += file.read(missing)
+            yield decode_block(line[:-1] if line.endswith('\n') else line, decode_table)
+            line = file.readline()
+
+
+def is_container_file(file_path) -> bool:
+    """
+    Check if the file is a binary container
+    :param file_path: file path
+    :return: bool
+    """
+    return starts_with_bytes(file_path, CONTAINER_MAGIC)
+
+
+def parse_container(data):
+    """
+    Parse a binary container from a buffer, without copying the payload
+    :param data: bytes, or an mmap of the file
+    :return: tuple of letter - code length hashmap, payload memoryview, original length in letters and flags
+    """
+    code_lengths, payload_offset, payload_length, original_length, flags = parse_container_header(data)
+    return code_lengths, memoryview(data)[payload_offset:payload_offset + payload_length], original_length, flags
+
+
+def parse_container_header(data):
+    """
+    :param data: bytes, or an mmap of the file
+    :return: tuple of letter - code length hashmap, payload offset and length in bytes, original length in letters
+             and flags
+    """
+    if data[:len(CONTAINER_MAGIC)] != CONTAINER_MAGIC:
+        raise Exception("not a Huffman container file!")
+    idx = len(CONTAINER_MAGIC)
+    version, flags, original_length, letters_amount = struct.unpack_from('>BBQI', data, idx)
+    if version != CONTAINER_VERSION:
+        raise Exception(f"unsupported container version {version}")
+    idx += struct.calcsize('>BBQI')
+    code_lengths = {}
+    for entry, in struct.iter_unpack('>I', data[idx:idx + 4 * letters_amount]):
+        code_lengths[chr(entry >> 8)] = entry & 0xFF
+    idx += 4 * letters_amount
+    payload_length, = struct.unpack_from('>Q', data, idx)
+    validate_code_lengths(code_lengths)
+    if original_length > (payload_length if flags & CONTAINER_FLAG_STORED else 8 * payload_length):
+        raise Exception("invalid container, the original length does not fit in the payload")  # every letter is a bit
+    if original_length and not code_lengths and not flags & CONTAINER_FLAG_STORED:
+        raise Exception("invalid container, no code table")
+    return code_lengths, idx + 8, payload_length, original_length, flags
+
+
+def seek_index_entry(data, index_offset: int, start: int) -> tuple:
+    """
+    Find the seek index entry at or before a letter, reads only that entry
+    :param data: bytes, or an mmap of the file
+    :param index_offset: first byte after the payload
+    :param start: letter index
+    :return: tuple of the entry's letter index and its payload bit offset
+    """
+    interval, entries = struct.unpack_from('>IQ', data, index_offset)
+    entry = min(start // interval, entries - 1)
+    bit_offset, = struct.unpack_from('>Q', data, index_offset + struct.calcsize('>IQ') + 8 * entry)
+    return entry * interval, bit_offset
+
+
+def read_range(file_path, start: int, length: int):
+    """
+    Decode only letters [start, start + length) of a binary container written with a seek index: decoding starts
+    at the index entry before `start`, so it costs at most one seek interval more than the range itself.
+    The file is memory mapped, only the pages of the range are read.
+    :param file_path: file path
+    :param start: first letter (byte in bytes mode) of the range
+    :param length: letters in the range
+    :return: the range's text (bytes in bytes mode)
+    """
+    with open(file_path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        code_lengths, payload_offset, payload_length, original_length, flags = parse_container_header(mapped)
+        if flags & CONTAINER_FLAG_STORED:
+            return stored_range(mapped, payload_offset, payload_length, start, length, flags, original_length)
+        if not flags & CONTAINER_FLAG_SEEK_INDEX:
+            raise Exception("the container has no seek index, compress it with --seekable")
+        length = max(min(length, original_length - start), 0)
+        text = ''
+        if length and start >= 0:
+            entry_start, bit_offset = seek_index_entry(mapped, payload_offset + payload_length, start)
+            skip = start - entry_start
+            with memoryview(mapped)[payload_offset:payload_offset + payload_length] as payload:
+                text = huffman_table_decoder(payload, build_decode_table(canonical_decode_hash(code_lengths)),
+                                             bit_offset=bit_offset, letters_amount=skip + length)[skip:]
+    if flags & CONTAINER_FLAG_BYTES:
+        return text.encode('latin-1')
+    return text
+
+
+def stored_range(data, payload_offset: int, payload_length: int, start: int, length: int, flags: int,
+                 original_length: int):
+    """
+    A range of a stored payload, no index is needed. Bytes, and text of one byte letters, are sliced as they are.
+    Other utf-8 text is sliced from the byte of its first letter, found by counting the bytes that start a letter
+    STORED_SCAN_BYTES at a time (nothing before it is decoded), to a letter boundary, and only the slice is decoded
+    :param data: bytes, or an mmap of the file
+    :param payload_offset: payload's first byte
+    :param payload_length: payload bytes amount
+    :param start: first letter (byte in bytes mode) of the range
+    :param length: letters in the range
+    :param flags: the container's flags
+    :param original_length: letters in the payload
+    :return: the range's text (bytes in bytes mode)
+    """
+    length = max(min(length, original_length - start), 0) if start >= 0 else 0
+    if flags & CONTAINER_FLAG_BYTES or original_length == payload_length:
+        stored = bytes(data[payload_offset + start:payload_offset + start + length]) if length else b''
+        return stored if flags & CONTAINER_FLAG_BYTES else stored.decode('utf-8')
+    if not length:
+        return ''
+    end = payload_offset + payload_length
+    begin = payload_offset
+    letters = 0
+    while True:
+        chunk = data[begin:min(begin + STORED_SCAN_BYTES, end)]
+        chunk_letters = len(chunk.translate(None, UTF8_CONTINUATION_BYTES))
+        if letters + chunk_letters > start:
+            break
+        letters += chunk_letters
+        begin += len(chunk)
+    while data[begin] in UTF8_CONTINUATION_BYTES:  # the rest of a letter counted in the previous chunk
+        begin += 1
+    stop = min(begin + 4 * (start - letters + length), end)  # a letter takes 4 bytes at most
+    while stop < end and data[stop] in UTF8_CONTINUATION_BYTES:
+        stop += 1
+    return bytes(data[begin:stop]).decode('utf-8')[start - letters:start - letters + length]
+
+
+def decode_container_payload(code_lengths: dict, payload, original_length: int, write=None, flags=0) -> str:
+    """
+    Decode a container's payload
+    :param code_lengths: letter - code length hashmap
+    :param payload: coded bytes
+    :param original_length: letters in the original text
+    :param write: decode straight to an output, see huffman_table_decoder
+    :param flags: the container's flags
+    :return: original text ('' when `write` is given)
+    """
+    if not original_length:
+        return ''
+    if flags & CONTAINER_FLAG_STORED:
+        original_text = bytes(payload).decode('latin-1' if flags & CONTAINER_FLAG_BYTES else 'utf-8')
+        if write is None:
+            return original_text
+        write(original_text)
+        return ''
+    if flags & CONTAINER_FLAG_INTERLEAVED:
+        original_text = decode_interleaved_payload(code_lengths, payload, original_length)
+        if write is None:
+            return original_text
+        write(original_text)
+        return ''
+    decode_table = build_decode_table(canonical_decode_hash(code_lengths))
+    return huffman_table_decoder(payload, decode_table, letters_amount=original_length, write=write)
+
+
+def split_interleaved_payload(payload) -> list:
+    """
+    Interleaved payload: streams amount (2 bytes) | byte length of every stream (8 each) | the streams
+    :param payload: coded bytes
+    :return: list of the streams, memoryviews of the payload
+    """
+    streams_amount, = struct.unpack_from('>H', payload, 0)
+    lengths = struct.unpack_from('>%dQ' % streams_amount, payload, 2)
+    idx = 2 + 8 * streams_amount
+    streams = []
+    for length in lengths:
+        streams.append(memoryview(payload)[idx:idx + length])
+        idx += length
+    return streams
+
+
+def decode_interleaved_payload(code_lengths: dict, payload, original_length: int, decode_table=None) -> str:
+    """
+    Decode an interleaved payload: letter j is in stream j % streams amount, so every stream is an independent
+    bit chain. Many streams with short codes are decoded in lockstep with NumPy, one letter of every stream per
+    step, otherwise stream after stream with the table decoder
+    :param code_lengths: letter - code length hashmap
+    :param payload: coded bytes, see split_interleaved_payload
+    :param original_length: letters in the original text
+    :param decode_table: output of build_decode_table, built here if not given
+    :return: original text
+    """
+    streams = split_interleaved_payload(payload)
+    if np is not None and len(streams) >= LOCKSTEP_MIN_STREAMS and \
+            max(code_lengths.values()) <= LOCKSTEP_MAX_CODE_LENGTH:
+        return lockstep_decode(code_lengths, streams, original_length)
+    if decode_table is None:
+        decode_table = build_decode_table(canonical_decode_hash(code_lengths))
+    letters = [''] * original_length
+    for i, stream in enumerate(streams):
+        letters_amount = len(range(i, original_length, len(streams)))
+        letters[i::len(streams)] = huffman_table_decoder(stream, decode_table, letters_amount=letters_amount)
+    return ''.join(letters)
+
+
+def lockstep_decode(code_lengths: dict, streams: list, original_length: int) -> str:
+    """
+    Decode all the interleaved streams together, every step decodes the next letter of every stream with a few
+    vectorized operations: gather 5 bytes at every stream's bit position, look the next max code length bits up in
+    a flat table, advance every position by its code length
+    :param code_lengths: letter - code length hashmap, no code longer than LOCKSTEP_MAX_CODE_LENGTH
+    :param streams: list of coded streams
+    :param original_length: letters in the original text
+    :return: original text
+    """
+    max_len = max(max(code_lengths.values()), 1)
+    table_letters = np.zeros(1 << max_len, dtype=np.uint32)
+    table_lengths = np.zeros(1 << max_len, dtype=np.int64)
+    for code, letter in canonical_decode_hash(code_lengths).items():
+        shift = max_len - len(code)
+        start = int(code, 2) << shift
+        table_letters[start:start + (1 << shift)] = ord(letter)
+        table_lengths[start:start + (1 << shift)] = len(code)
+
+    buffer = np.frombuffer(b''.join(bytes(stream) for stream in streams) + bytes(8), dtype=np.uint8).astype(np.uint64)
+    positions = np.cumsum([0] + [8 * len(stream) for stream in streams[:-1]]).astype(np.int64)
+    steps = -(-original_length // len(streams))
+    output = np.empty((steps, len(streams)), dtype=np.uint32)
+    mask = np.uint64((1 << max_len) - 1)
+    for step in range(steps):
+        idx = positions >> 3
+        window = (buffer[idx] << np.uint64(32)) | (buffer[idx + 1] << np.uint64(24)) | \
+            (buffer[idx + 2] << np.uint64(16)) | (buffer[idx + 3] << np.uint64(8)) | buffer[idx + 4]
+        codes = (window >> (40 - max_len - (positions & 7)).astype(np.uint64)) & mask
+        output[step] = table_letters[codes]
+        positions += table_lengths[codes]  # a finished stream decodes padding, it is cut off below
+    return output.reshape(-1)[:original_length].tobytes().decode('utf-32-le' if sys.byteorder == 'little' else
+                                                                  'utf-32-be')
+
+
+def container_decompress(file_path, file_name: str):
+    """
+    Decode a memory mapped binary container straight to the output file, a block of letters at a time,
+    so memory stays about the size of the mapped pages and one block of letters
+    :param file_path: file path
+    :param file_name: file name to write to
+    :return: None
+    """
+    with open(file_path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        code_lengths, payload, original_length, flags = parse_container(mapped)
+        with payload:
+            if flags & CONTAINER_FLAG_STORED:  # utf-8 text or bytes, copied as they are
+                with open(file_name, 'wb') as new_file:
+                    new_file.write(payload)
+            elif flags & CONTAINER_FLAG_BYTES:
+                with open(file_name, 'wb') as new_file:
+                    decode_container_payload(code_lengths, payload, original_length,
+                                             write=lambda text: new_file.write(text.encode('latin-1')), flags=flags)
+            else:
+                with open(file_name, 'w', encoding='utf-8') as new_file:
+                    decode_container_payload(code_lengths, payload, original_length, write=new_file.write,
+                                             flags=flags)
+
+
+def read_dictionary(file_path) -> tuple:
+    """
+    Read a dictionary file: magic (4 bytes) | version (1) | dictionary id (4) | code length of every byte (256)
+    :param file_path: file path
+    :return: tuple of dictionary id and letter - code length hashmap
+    """
+    with open(file_path, 'rb') as file:
+        data = file.read()
+    if data[:len(DICTIONARY_MAGIC)] != DICTIONARY_MAGIC:
+        raise Exception("not a Huffman dictionary file!")
+    version, dictionary_id = struct.unpack_from('>BI', data, len(DICTIONARY_MAGIC))
+    if version != DICTIONARY_VERSION:
+        raise Exception(f"unsupported dictionary version {version}")
+    table = data[len(DICTIONARY_MAGIC) + 5:len(DICTIONARY_MAGIC) + 5 + 256]
+    return dictionary_id, {chr(integer_bits): length for integer_bits, length in enumerate(table)}
+
+
+def is_dictionary_message(data) -> bool:
+    """
+    :param data: bytes
+    :return: True if data is a message compressed with a pre-trained dictionary
+    """
+    return data[:len(DICTIONARY_MESSAGE_MAGIC)] == DICTIONARY_MESSAGE_MAGIC
+
+
+def dictionary_message_id(data) -> int:
+    """
+    :param data: message compressed with a pre-trained dictionary
+    :return: the id of the dictionary it needs
+    """
+    return struct.unpack_from('>I', data, len(DICTIONARY_MESSAGE_MAGIC))[0]
+
+
+def decode_varint(data, idx: int) -> tuple:
+    """
+    :param data: bytes
+    :param idx: varint's first byte
+    :return: tuple of the number and the index after the varint
+    """
+    number = 0
+    shift = 0
+    while True:
+        byte = data[idx]
+        idx += 1
+        number |= (byte & 0x7F) << shift
+        shift += 7
+        if byte < 0x80:
+            return number, idx
+
+
+def parse_dictionary_message(data) -> tuple:
+    """
+    Parse a message compressed with a pre-trained dictionary:
+    magic (3 bytes) | dictionary id (4) | original length (varint) | payload
+    :param data: bytes
+    :return: tuple of dictionary id, original length and payload memoryview
+    """
+    if not is_dictionary_message(data):
+        raise Exception("not a dictionary compressed message!")
+    dictionary_id = dictionary_message_id(data)
+    original_length, idx = decode_varint(data, len(DICTIONARY_MESSAGE_MAGIC) + 4)
+    return dictionary_id, original_length, memoryview(data)[idx:]
+
+
+def dictionary_decompress(data, dictionary_id: int, decode_table) -> bytes:
+    """
+    Decode a message compressed with a pre-trained dictionary, a payload as long as the original length is the
+    message stored raw (see dictionary_compress in the compression script)
+    :param data: compressed message
+    :param dictionary_id: id of the dictionary of decode_table
+    :param decode_table: build_decode_table of the dictionary's canonical codes
+    :return: original bytes
+    """
+    message_dictionary_id, original_length, payload = parse_dictionary_message(data)
+    if message_dictionary_id != dictionary_id:
+        raise Exception(f"message needs dictionary {message_dictionary_id:08x}, got {dictionary_id:08x}")
+    with payload:
+        if len(payload) == original_length:
+            return bytes(payload)
+        return huffman_table_decoder(payload, decode_table, letters_amount=original_length).encode('latin-1')
+
+
+def read_block_index(file_path):
+    """
+    Read the block index from the last line of a parallel blocks file, reading backwards from the end of the file
+    :param file_path: file path
+    :return: tuple of the block lines offsets and the index line offset (= end of the last block)
+    """
+    with open(file_path, "rb") as file:
+        end = file.seek(0, os.SEEK_END)
+        tail = b''
+        while b'\n' not in tail and len(tail) < end:
+            step = min(1 << 16, end - len(tail))
+            file.seek(end - len(tail) - step)
+            tail = file.read(step) + tail
+    index_start = end - len(tail) + tail.rfind(b'\n') + 1
+    index = tail[tail.rfind(b'\n') + 1 + len(BLOCK_INDEX_TAG):].decode('utf-8')
+    return [int(offset) for offset in index.split(',') if offset], index_start
+
+
+def decompress_block(block, file_path, shared_header: str) -> str:
+    """
+    Decode one independently decodable block of a parallel blocks file, runs in a worker process
+    :param block: tuple of the block line start and end offsets in the file
+    :param file_path: file path
+    :param shared_header: the file's shared code lengths header, used when the block has no table of its own
+    :return: block's original text
+    """
+    start, end = block
+    with open(file_path, "rb") as file:
+        file.seek(start)
+        line = file.read(end - start).decode('utf-8')
+    line = line[:-1] if line.endswith('\n') else line
+    if line.startswith(STORED_HEADER_TAG):
+        return decode_block(line, None)
+    header, text = line.split('|', 1)
+    code_lengths = parse_canonical_header(header or shared_header)
+    return decode_block(text, build_decode_table(canonical_decode_hash(code_lengths)))
+
+
+def bounded_map(executor, function, iterable, *extra_args, max_pending=2):
+    """
+    Same as executor.map, but keeps at most `max_pending` tasks in flight, so the decoded blocks do not pile up
+    :param executor: concurrent.futures executor
+    :param function: function to call on every item
+    :param iterable: items
+    :param extra_args: more arguments for every call
+    :param max_pending: tasks in flight, about twice the workers amount keeps all the workers busy
+    :return: generator of the results, in order
+    """
+    pending = deque()
+    for item in iterable:
+        pending.append(executor.submit(function, item, *extra_args))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def parallel_decoding(file_path, workers=None):
+    """
+    Decode a parallel blocks file, the blocks are decoded in a process pool
+    :param file_path: file path
+    :param workers: worker processes, default - one per core
+    :return: generator of the original text, block by block
+    """
+    with open(file_path, "rb") as file:
+        shared_header = file.readline().decode('utf-8').rstrip('\n')[len(PARALLEL_HEADER_TAG):]
+    block_index, index_start = read_block_index(file_path)
+    blocks = list(zip(block_index, block_index[1:] + [index_start]))
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from bounded_map(executor, decompress_block, blocks, file_path, shared_header, max_pending=2 * workers)
+
+
+def text_decoding(text, huffman_histogram: dict, reference=False):
     """
     Decode a text string by Huffman histogram.
     The first letter in the text string is the place-holder indicator
     :param text: string
     :param huffman_histogram: hashmap of binary_sequence-letter
+    :param reference: decode bit by bit with huffman_decoder (slow, kept for differential testing)
     :return: Original text
     """
-    placeholder = text[0]
-    binary_text = text_to_binary(text[1:], placeholder=placeholder)
-    original_binary = zero_padding_organizer(binary_text)
-    return huffman_decoder(original_binary, huffman_histogram)
+    if reference:
+        placeholder = text[0]
+        binary_text = text_to_binary(text[1:], placeholder=placeholder)
+        original_binary = zero_padding_organizer(binary_text)
+        return huffman_decoder(original_binary, huffman_histogram)
+    return decode_block(text, build_decode_table(huffman_histogram))
+
+
+def file_size(file_path) -> int:
+    """
+    :return: file size in bytes, 0 if the file does not exist
+    """
+    return os.path.getsize(file_path) if os.path.exists(file_path) else 0
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Huffman decompression")
+    parser.add_argument("file_name", nargs="?", help="file to decompress")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes for parallel blocks files")
+    parser.add_argument("--dictionary", metavar="DICTIONARY_FILE", default=None,
+                        help="dictionary file for messages compressed with a pre-trained dictionary")
+    parser.add_argument("--range", metavar=("START", "LENGTH"), nargs=2, type=int, default=None,
+                        help="decode only this range of letters from a binary container with a seek index")
+    parser.add_argument("--profile", action="store_true",
+                        help="report time and bytes per stage (same as the HUFFMAN_PROFILE environment variable)")
+    parser.add_argument("--profile-options", metavar="OPTIONS", default=None,
+                        help="comma separated stages, tracemalloc, cprofile, implies --profile (default - stages)")
+    parser.add_argument("--profile-output", metavar="FILE", default=None,
+                        help="write the profile report to FILE instead of stderr")
+    return parser.parse_args()
 
 
 def main():
     output_file = "ID1_ID2_decompressed.txt"
     garbage = None
     try:
-        if (len(sys.argv)) > 1:
-            file_name = sys.argv[1]
-            if os.path.exists(file_name):
-                file_directory = os.getcwd()
-                file_path = file_directory + '/' + file_name
-                text = read_file(file_path)
-                if text:
-                    preorder, text = extract_order(text)
-                    inorder, text = extract_order(text)
-                    root, garbage = buildTree(inorder=inorder, preorder=preorder, in_start=0, in_end=len(inorder) - 1)
-                    huffman_codes_hash = build_huffman_codes(root)
-                    original_text = text_decoding(text, huffman_histogram=huffman_codes_hash)
+        args = parse_arguments()
+        if args.profile or args.profile_options:
+            profiler.configure(args.profile_options or "stages", args.profile_output)
+        if args.file_name:
+            file_name = args.file_name
+            if os.path.exists(file_name) and args.dictionary:
+                dictionary_id, code_lengths = read_dictionary(args.dictionary)
+                with open(file_name, 'rb') as file:
+                    data = file.read()
+                decode_table = build_decode_table(canonical_decode_hash(code_lengths))
+                with profiler.stage("dictionary_decompress", len(data)) as stage, open(output_file, 'wb') as new_file:
+                    stage.bytes_out = new_file.write(dictionary_decompress(data, dictionary_id, decode_table))
+            elif os.path.exists(file_name) and starts_with_bytes(file_name, DICTIONARY_MESSAGE_MAGIC):
+                with open(file_name, 'rb') as file:
+                    data = file.read(len(DICTIONARY_MESSAGE_MAGIC) + 4)
+                print(f"{file_name} was compressed with dictionary {dictionary_message_id(data):08x}, "
+                      f"pass the dictionary file with --dictionary. Exiting...")
+                sleep(2)
+                exit(-1)
+            elif os.path.exists(file_name) and starts_with_bytes(file_name, ADAPTIVE_MAGIC):
+                from adaptive_huffman import adaptive_decompress
+                with profiler.stage("adaptive_decompress", file_size(file_name)) as stage:
+                    adaptive_decompress(file_name, output_file)
+                    stage.bytes_out = file_size(output_file)
+            elif os.path.exists(file_name) and starts_with_bytes(file_name, TOKEN_MAGIC):
+                from token_huffman import token_decompress
+                with profiler.stage("token_decompress", file_size(file_name)) as stage:
+                    token_decompress(file_name, output_file)
+                    stage.bytes_out = file_size(output_file)
+            elif os.path.exists(file_name) and starts_with_bytes(file_name, LOG_MAGIC):
+                from log_huffman import log_decompress
+                with profiler.stage("log_decompress", file_size(file_name)) as stage:
+                    log_decompress(file_name, output_file)
+                    stage.bytes_out = file_size(output_file)
+            elif os.path.exists(file_name) and is_container_file(file_name) and args.range:
+                with profiler.stage("read_range", args.range[1]) as stage:
+                    original_text = read_range(file_name, *args.range)
+                    stage.bytes_out = len(original_text)
+                if isinstance(original_text, bytes):
+                    with open(output_file, 'wb') as new_file:
+                        new_file.write(original_text)
+                else:
                     write_to_txt_file(original_text, output_file)
+            elif os.path.exists(file_name) and is_container_file(file_name):
+                with profiler.stage("container_decompress", file_size(file_name)) as stage:
+                    container_decompress(file_name, output_file)
+                    stage.bytes_out = file_size(output_file)
+            elif os.path.exists(file_name) and is_stored_file(file_name):
+                with profiler.stage("stored_decompress", file_size(file_name)) as stage:
+                    stored_decompress(file_name, output_file)
+                    stage.bytes_out = file_size(output_file)
+            elif os.path.exists(file_name) and is_parallel_file(file_name):
+                with profiler.stage("parallel_decoding", file_size(file_name)) as stage, \
+                        open(output_file, 'w', encoding='utf-8') as new_file:
+                    for original_text in parallel_decoding(file_name, workers=args.workers):
+                        new_file.write(original_text)
+                        stage.bytes_out += len(original_text)
+            elif os.path.exists(file_name) and is_stream_file(file_name):
+                with profiler.stage("stream_decoding", file_size(file_name)) as stage, \
+                        open(output_file, 'w', encoding='utf-8') as new_file:
+                    for original_text in stream_decoding(file_name):
+                        new_file.write(original_text)
+                        stage.bytes_out += len(original_text)
+            elif os.path.exists(file_name):
+                file_directory = os.getcwd()
+                file_path = os.path.join(file_directory, file_name)
+                with profiler.stage("read_file", file_size(file_path)):
+                    text = read_file(file_path)
+                if text and has_canonical_header(text):
+                    with profiler.stage("extract_canonical_header", len(text)):
+                        code_lengths, text = extract_canonical_header(text)
+                        huffman_codes_hash = canonical_decode_hash(code_lengths)
+                    with profiler.stage("text_decoding", len(text)) as stage:
+                        original_text = text_decoding(text, huffman_histogram=huffman_codes_hash)
+                        stage.bytes_out = len(original_text)
+                    with profiler.stage("write_to_txt_file", len(original_text)):
+                        write_to_txt_file(original_text, output_file)
+                elif text:
+                    with profiler.stage("extract_order", len(text)):
+                        preorder, text = extract_order(text)
+                        inorder, text = extract_order(text)
+                    with profiler.stage("buildTree", len(inorder)):
+                        root, garbage = buildTree(inorder=inorder, preorder=preorder, in_start=0,
+                                                  in_end=len(inorder) - 1)
+                    with profiler.stage("build_huffman_codes", len(inorder)):
+                        huffman_codes_hash = build_huffman_codes(root)
+                    with profiler.stage("text_decoding", len(text)) as stage:
+                        original_text = text_decoding(text, huffman_histogram=huffman_codes_hash)
+                        stage.bytes_out = len(original_text)
+                    with profiler.stage("write_to_txt_file", len(original_text)):
+                        write_to_txt_file(original_text, output_file)
             else:
                 print(f"Did not found file name {file_name}. Exiting...")
                 sleep(2)
@@ -317,6 +1241,7 @@ def main():
             print("No file has been chosen! Exiting...")
             sleep(2)
             exit(-1)
+        profiler.finish()
     except Exception as e:
         frame = inspect.trace()[-1]
         line_number = frame.lineno
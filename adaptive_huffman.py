@@ -0,0 +1,242 @@
+from ID1_ID2_compression import BitWriter
+
+ALPHABET_SIZE = 256  # byte values
+RAW_SYMBOL_BITS = 9  # a new symbol is sent raw after the NYT code: the 256 byte values and FLUSH
+FLUSH = 256  # end of message marker, always sent raw after the NYT code and never added to the tree
+ADAPTIVE_MAGIC = b'\x89HUA'  # first bytes of a file compressed in adaptive mode
+
+
+class AdaptiveHuffmanTree:
+    """
+    FGK adaptive Huffman tree over the byte values.
+    Nodes live in flat lists indexed by their FGK number, the root has the highest number. Weights never decrease
+    with the number (the sibling property), so all the nodes with the same weight are consecutive numbers, and the
+    highest of them (the block leader) is found by scanning up from a node.
+    Encoder and decoder build the same tree by calling update() with the same symbols.
+    """
+    def __init__(self):
+        size = 2 * ALPHABET_SIZE + 1
+        self.root = size - 1
+        self.nyt = self.root  # Not Yet Transmitted, the leaf that stands for every symbol not seen yet
+        self.weight = [0] * size
+        self.parent = [-1] * size
+        self.left = [-1] * size
+        self.right = [-1] * size
+        self.symbol = [-1] * size
+        self.leaf_of = [-1] * ALPHABET_SIZE
+
+    def code(self, node: int) -> tuple:
+        """
+        :param node: node number
+        :return: tuple of the node's code value and length, left is 0 and right is 1
+        """
+        value = 0
+        length = 0
+        while node != self.root:
+            parent = self.parent[node]
+            if self.right[parent] == node:
+                value |= 1 << length
+            length += 1
+            node = parent
+        return value, length
+
+    def swap(self, first: int, second: int):
+        """
+        Swap the subtrees at two node numbers, each number keeps its parent
+        """
+        for values in (self.weight, self.left, self.right, self.symbol):
+            values[first], values[second] = values[second], values[first]
+        for node in (first, second):
+            if self.left[node] != -1:
+                self.parent[self.left[node]] = node
+                self.parent[self.right[node]] = node
+            elif self.symbol[node] != -1:
+                self.leaf_of[self.symbol[node]] = node
+        if self.nyt == first:
+            self.nyt = second
+        elif self.nyt == second:
+            self.nyt = first
+
+    def update(self, symbol: int):
+        """
+        Count one more appearance of the symbol, a new symbol splits the NYT leaf into a new NYT and its leaf
+        """
+        node = self.leaf_of[symbol]
+        if node == -1:
+            old_nyt = self.nyt
+            self.nyt = old_nyt - 2
+            node = old_nyt - 1
+            self.left[old_nyt] = self.nyt
+            self.right[old_nyt] = node
+            self.parent[self.nyt] = old_nyt
+            self.parent[node] = old_nyt
+            self.symbol[node] = symbol
+            self.leaf_of[symbol] = node
+        while node != self.root:
+            leader = node
+            while leader < self.root and self.weight[leader + 1] == self.weight[node]:
+                leader += 1
+            if leader != node and leader != self.parent[node]:
+                self.swap(node, leader)
+                node = leader
+            self.weight[node] += 1
+            node = self.parent[node]
+        self.weight[self.root] += 1
+
+
+class AdaptiveHuffmanEncoder:
+    """
+    One-pass adaptive Huffman encoder for live streams: no histogram, no header.
+    encode() returns the whole bytes encoded so far, flush() ends a message and pads it to a byte boundary,
+    so every message can be sent as soon as it is complete.
+    """
+    def __init__(self):
+        self.tree = AdaptiveHuffmanTree()
+        self.writer = BitWriter()
+
+    def _write_symbol(self, symbol: int):
+        tree = self.tree
+        node = tree.leaf_of[symbol] if symbol != FLUSH else -1
+        if node == -1:
+            self.writer.write(*tree.code(tree.nyt))
+            self.writer.write(symbol, RAW_SYMBOL_BITS)
+        else:
+            self.writer.write(*tree.code(node))
+        if symbol != FLUSH:
+            tree.update(symbol)
+
+    def _take_bytes(self) -> bytes:
+        data = bytes(self.writer.buffer)
+        self.writer.buffer.clear()
+        return data
+
+    def encode(self, data: bytes) -> bytes:
+        """
+        :param data: bytes
+        :return: the encoded bytes that are complete, the last partial byte waits for the next call
+        """
+        for symbol in data:
+            self._write_symbol(symbol)
+        return self._take_bytes()
+
+    def flush(self) -> bytes:
+        """
+        End the current message
+        :return: the rest of the message's encoded bytes
+        """
+        self._write_symbol(FLUSH)
+        if self.writer.pending_bits:
+            self.writer.write(0, 8 - self.writer.pending_bits)
+        return self._take_bytes()
+
+
+class AdaptiveHuffmanDecoder:
+    """
+    Decoder of AdaptiveHuffmanEncoder's output. Input can be fed in pieces of any size,
+    a code split between two pieces is resumed on the next call.
+    """
+    def __init__(self):
+        self.tree = AdaptiveHuffmanTree()
+        self.node = self.tree.root
+        self.raw_bits = -1  # bits of the raw symbol read so far, -1 when not reading a raw symbol
+        self.raw_value = 0
+        self.message = bytearray()
+        if self.node == self.tree.nyt:
+            self.raw_bits = 0
+
+    def _decode(self, data: bytes) -> tuple:
+        """
+        :return: tuple of the decoded bytes and the positions in them where a message ended
+        """
+        tree = self.tree
+        output = bytearray()
+        message_ends = []
+        for byte in data:
+            for shift in range(7, -1, -1):
+                bit = (byte >> shift) & 1
+                if self.raw_bits >= 0:
+                    self.raw_value = (self.raw_value << 1) | bit
+                    self.raw_bits += 1
+                    if self.raw_bits < RAW_SYMBOL_BITS:
+                        continue
+                    symbol = self.raw_value
+                    self.raw_bits = -1
+                    self.raw_value = 0
+                    if symbol == FLUSH:
+                        message_ends.append(len(output))
+                        self.node = tree.root
+                        if self.node == tree.nyt:
+                            self.raw_bits = 0
+                        break  # the rest of the byte is padding
+                else:
+                    self.node = tree.right[self.node] if bit else tree.left[self.node]
+                    if self.node == tree.nyt:
+                        self.raw_bits = 0
+                        continue
+                    if tree.symbol[self.node] == -1:
+                        continue
+                    symbol = tree.symbol[self.node]
+                output.append(symbol)
+                tree.update(symbol)
+                self.node = tree.root
+        return output, message_ends
+
+    def decode(self, data: bytes) -> bytes:
+        """
+        :param data: encoded bytes
+        :return: the bytes decoded from them (message boundaries are dropped)
+        """
+        return bytes(self._decode(data)[0])
+
+    def decode_messages(self, data: bytes) -> list:
+        """
+        :param data: encoded bytes
+        :return: the messages completed in this data, an unfinished message is kept until its flush arrives
+        """
+        output, message_ends = self._decode(data)
+        messages = []
+        start = 0
+        for end in message_ends:
+            self.message += output[start:end]
+            messages.append(bytes(self.message))
+            self.message.clear()
+            start = end
+        self.message += output[start:]
+        return messages
+
+
+def adaptive_compress(file_path, file_name: str, chunk_size=1 << 16):
+    """
+    Compress a file in one pass, chunk by chunk, the file can be a pipe.
+    File format: ADAPTIVE_MAGIC, then the encoder's output ended with one flush
+    :param file_path: file to compress
+    :param file_name: file name to write to
+    :param chunk_size: bytes read at a time
+    :return: None
+    """
+    encoder = AdaptiveHuffmanEncoder()
+    with open(file_path, 'rb') as file, open(file_name, 'wb') as new_file:
+        new_file.write(ADAPTIVE_MAGIC)
+        chunk = file.read(chunk_size)
+        while chunk:
+            new_file.write(encoder.encode(chunk))
+            chunk = file.read(chunk_size)
+        new_file.write(encoder.flush())
+
+
+def adaptive_decompress(file_path, file_name: str, chunk_size=1 << 16):
+    """
+    Decompress a file written by adaptive_compress, chunk by chunk
+    :param file_path: file to decompress
+    :param file_name: file name to write to
+    :param chunk_size: bytes read at a time
+    :return: None
+    """
+    decoder = AdaptiveHuffmanDecoder()
+    with open(file_path, 'rb') as file, open(file_name, 'wb') as new_file:
+        if file.read(len(ADAPTIVE_MAGIC)) != ADAPTIVE_MAGIC:
+            raise Exception("not an adaptive Huffman file!")
+        chunk = file.read(chunk_size)
+        while chunk:
+            new_file.write(decoder.decode(chunk))
+            chunk = file.read(chunk_size)
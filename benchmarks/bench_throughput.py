@@ -0,0 +1,213 @@
+"""
+Benchmark and regression suite for the compression and decompression entry points.
+
+Every run calls the scripts' main() in a fresh interpreter (like the command line does) inside a temporary
+directory, over Alice_in_wonderlands.txt and over synthetic corpora of several sizes and skews.
+Reports, as JSON: compress and decompress MB/s, peak RSS of each run, compression ratio and header overhead
+(everything in the compressed file that is not Huffman payload: headers, escaping, padding, framing).
+The times include the interpreter start, so use corpora of a few MB for meaningful MB/s.
+
+usage:
+    python benchmarks/bench_throughput.py [--sizes 1000000,4000000]
+                                          [--modes default,canonical,binary,stream,bytes,interleaved]
+                                          [--output results.json] [--baseline baseline.json] [--tolerance 0.1]
+                                          [--ratio-tolerance 0.01] [--repeat 3]
+
+With --baseline, every result is compared to the stored one with the same corpus and mode, and the run exits
+with status 1 if the throughput dropped by more than --tolerance, or the ratio got worse by more than
+--ratio-tolerance (relative, both). The ratio does not depend on the machine, so its default is much tighter.
+"""
+import os
+import sys
+import json
+import random
+import argparse
+import platform
+import subprocess
+import tempfile
+from time import perf_counter
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from ID1_ID2_compression import filter_abc, build_canonical_code, encoded_size  # noqa: E402
+
+COMPRESSION_SCRIPT = os.path.join(REPO_DIR, "ID1_ID2_compression.py")
+DECOMPRESSION_SCRIPT = os.path.join(REPO_DIR, "ID1_ID2_decompression.py")
+COMPRESSED_FILE = "ID1_ID2_compressed.txt"
+DECOMPRESSED_FILE = "ID1_ID2_decompressed.txt"
+
+# mode name - (compression script flags, works on text corpora, works on binary corpora)
+MODES = {
+    "default": ([], True, False),
+    "canonical": (["--canonical"], True, False),
+    "binary": (["--binary"], True, False),
+    "stream": (["--stream"], True, False),
+    "bytes": (["--bytes"], True, True),
+    "interleaved": (["--bytes", "--interleave"], True, True),
+}
+
+# runs a script as __main__ and prints its peak RSS (KB on Linux) as the last output line
+RUNNER = """
+import os, sys, runpy, resource
+script = sys.argv[1]
+sys.argv = sys.argv[1:]
+sys.path.insert(0, os.path.dirname(script))  # like running the script directly, its sibling modules import
+try:
+    runpy.run_path(script, run_name='__main__')
+finally:
+    print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+def make_corpora(sizes: list, seed: int = 0) -> list:
+    """
+    :param sizes: sizes in bytes of the synthetic corpora
+    :param seed: random seed
+    :return: list of (corpus name, data bytes, is text)
+    """
+    rnd = random.Random(seed)
+    printable = [chr(i) for i in range(32, 127)] + ['\n']
+    zipf_weights = [1 / (rank + 1) for rank in range(len(printable))]
+    corpora = []
+    with open(os.path.join(REPO_DIR, "Alice_in_wonderlands.txt"), "rb") as file:
+        corpora.append(("alice", file.read(), True))
+    for size in sizes:
+        corpora.append((f"uniform_{size}", ''.join(rnd.choices(printable, k=size)).encode('ascii'), True))
+        corpora.append((f"zipf_{size}", ''.join(rnd.choices(printable, weights=zipf_weights, k=size)).encode('ascii'),
+                        True))
+        corpora.append((f"single_{size}", b'a' * size, True))
+        corpora.append((f"bytes256_{size}", rnd.randbytes(size), False))
+    return corpora
+
+
+def payload_size(data: bytes, is_text: bool) -> int:
+    """
+    Size of the bare payload of the data, in bytes: the Huffman codes, or the data itself when they would not be
+    smaller (the compressor stores such data raw), so no mode can come out below it
+    """
+    text = data.decode('utf-8') if is_text else data.decode('latin-1')
+    histogram = filter_abc(text)
+    huffman_code, code_lengths = build_canonical_code(histogram)
+    return min(encoded_size(histogram, code_lengths), len(data))
+
+
+def run_script(script: str, args: list, cwd: str):
+    """
+    :return: tuple of wall time in seconds, peak RSS in MB and whether the script exited successfully
+    """
+    start = perf_counter()
+    result = subprocess.run([sys.executable, "-c", RUNNER, script] + args, cwd=cwd, capture_output=True, text=True)
+    elapsed = perf_counter() - start
+    peak_rss = int(result.stdout.strip().splitlines()[-1])
+    if platform.system() == "Darwin":  # ru_maxrss is in bytes on macOS, KB elsewhere
+        peak_rss //= 1024
+    return elapsed, peak_rss / 1024, result.returncode == 0
+
+
+def bench(corpus_name: str, data: bytes, is_text: bool, mode: str, repeat: int = 1) -> dict:
+    """
+    Compress and decompress the data `repeat` times, keeps the best times
+    """
+    runs = [bench_once(data, mode) for _ in range(repeat)]
+    compress_time, compress_rss, decompress_time, decompress_rss, compressed_size, round_trip = runs[0]
+    compress_time = min(run[0] for run in runs)
+    decompress_time = min(run[2] for run in runs)
+    megabytes = len(data) / 1e6
+    return {
+        "corpus": corpus_name,
+        "mode": mode,
+        "original_bytes": len(data),
+        "compressed_bytes": compressed_size,
+        "ratio": compressed_size / len(data),
+        "header_overhead_bytes": compressed_size - payload_size(data, is_text),
+        "compress_mb_s": megabytes / compress_time,
+        "decompress_mb_s": megabytes / decompress_time,
+        "compress_peak_rss_mb": compress_rss,
+        "decompress_peak_rss_mb": decompress_rss,
+        "round_trip": all(run[5] for run in runs),
+    }
+
+
+def bench_once(data: bytes, mode: str):
+    """
+    :return: tuple of compress time, compress peak RSS, decompress time, decompress peak RSS, compressed size and
+             whether the round trip gave back the data
+    """
+    flags = MODES[mode][0]
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_name = "input.bin"
+        with open(os.path.join(work_dir, input_name), "wb") as file:
+            file.write(data)
+        compress_time, compress_rss, compress_ok = run_script(COMPRESSION_SCRIPT, [input_name] + flags, work_dir)
+        compressed_path = os.path.join(work_dir, COMPRESSED_FILE)
+        compressed_size = os.path.getsize(compressed_path) if os.path.exists(compressed_path) else 0
+        decompress_time, decompress_rss, decompress_ok = run_script(DECOMPRESSION_SCRIPT, [COMPRESSED_FILE], work_dir)
+        round_trip = False
+        if compress_ok and decompress_ok and os.path.exists(os.path.join(work_dir, DECOMPRESSED_FILE)):
+            with open(os.path.join(work_dir, DECOMPRESSED_FILE), "rb") as file:
+                round_trip = file.read() == data
+    return compress_time, compress_rss, decompress_time, decompress_rss, compressed_size, round_trip
+
+
+def compare(results: list, baseline: list, tolerance: float, ratio_tolerance: float) -> list:
+    """
+    :param tolerance: allowed relative throughput drop
+    :param ratio_tolerance: allowed relative ratio increase
+    :return: list of regression descriptions
+    """
+    stored = {(result["corpus"], result["mode"]): result for result in baseline}
+    regressions = []
+    for result in results:
+        old = stored.get((result["corpus"], result["mode"]))
+        if not result["round_trip"]:
+            regressions.append(f'{result["corpus"]}/{result["mode"]}: round trip failed')
+        if not old:
+            continue
+        for key in ("compress_mb_s", "decompress_mb_s"):
+            if result[key] < old[key] * (1 - tolerance):
+                regressions.append(f'{result["corpus"]}/{result["mode"]}: {key} {old[key]:.2f} -> {result[key]:.2f}')
+        if result["ratio"] > old["ratio"] * (1 + ratio_tolerance):
+            regressions.append(f'{result["corpus"]}/{result["mode"]}: ratio {old["ratio"]:.4f} -> '
+                               f'{result["ratio"]:.4f}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000000,4000000", help="synthetic corpora sizes in bytes")
+    parser.add_argument("--modes", default=",".join(MODES), help="comma separated, out of: " + ",".join(MODES))
+    parser.add_argument("--corpora", default=None, help="comma separated corpus name prefixes to run, default - all")
+    parser.add_argument("--output", default=None, help="write the results JSON to this file")
+    parser.add_argument("--baseline", default=None, help="results JSON of a previous run to compare with")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per corpus and mode, the best time is kept")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed relative throughput drop")
+    parser.add_argument("--ratio-tolerance", type=float, default=0.01, help="allowed relative ratio increase")
+    args = parser.parse_args()
+
+    corpora = make_corpora([int(size) for size in args.sizes.split(",") if size])
+    if args.corpora:
+        prefixes = tuple(args.corpora.split(","))
+        corpora = [corpus for corpus in corpora if corpus[0].startswith(prefixes)]
+    results = []
+    for corpus_name, data, is_text in corpora:
+        for mode in args.modes.split(","):
+            if (is_text and MODES[mode][1]) or (not is_text and MODES[mode][2]):
+                results.append(bench(corpus_name, data, is_text, mode, args.repeat))
+                print(json.dumps(results[-1]), file=sys.stderr)
+
+    report = {"python": platform.python_version(), "results": results}
+    if args.baseline:
+        with open(args.baseline) as file:
+            report["regressions"] = compare(results, json.load(file)["results"], args.tolerance,
+                                             args.ratio_tolerance)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    print(json.dumps(report, indent=2))
+    if report.get("regressions"):
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
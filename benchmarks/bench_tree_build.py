@@ -0,0 +1,60 @@
+"""
+Benchmark the Huffman tree builders on growing alphabets.
+
+Compares the original re-sort-per-merge builder (create_huffman_tree) with the heap and the two-queues engines,
+and with the array-backed FlatHuffmanTree (which builds the same tree as the two-queues engine, without Node objects).
+The original builder is O(n^2 log n), so it only runs up to --legacy-max symbols.
+
+usage: python benchmarks/bench_tree_build.py [--sizes 256,4096,65536,1048576] [--legacy-max 4096]
+"""
+import os
+import sys
+import random
+import argparse
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ID1_ID2_compression import Node, sort_histogram, create_huffman_tree, create_huffman_tree_heap, \
+    create_huffman_tree_two_queues, FlatHuffmanTree  # noqa: E402
+
+
+def make_histogram(size: int, seed: int = 0) -> dict:
+    """
+    Zipf-like histogram over `size` distinct symbols (single characters, so the tree nodes look like real leaves)
+    :param size: alphabet size
+    :param seed: random seed
+    :return: letter histogram
+    """
+    rnd = random.Random(seed)
+    return {chr(i): int(1_000_000 / (i + 1)) + rnd.randint(1, 10) for i in range(size)}
+
+
+def time_builder(builder, histogram_items: list) -> float:
+    nodes_list = [(Node(letters=key, count=val), val) for key, val in histogram_items]
+    start = perf_counter()
+    builder(nodes_list, len(nodes_list))
+    return perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="256,1024,4096,16384,65536,262144,1048576")
+    parser.add_argument("--legacy-max", type=int, default=4096)
+    args = parser.parse_args()
+
+    print(' Symbols  | legacy (s) | heap (s) | two queues (s) | flat (s)')
+    for size in [int(x) for x in args.sizes.split(",")]:
+        histogram_items = sort_histogram(make_histogram(size))
+        legacy = time_builder(create_huffman_tree, histogram_items) if size <= args.legacy_max else None
+        heap = time_builder(create_huffman_tree_heap, histogram_items)
+        two_queues = time_builder(create_huffman_tree_two_queues, histogram_items)
+        start = perf_counter()
+        FlatHuffmanTree(histogram_items)
+        flat = perf_counter() - start
+        legacy = '%10.4f' % legacy if legacy is not None else '%10s' % 'skipped'
+        print(' %-8d | %s | %8.4f | %14.4f | %8.4f' % (size, legacy, heap, two_queues, flat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,399 @@
+"""
+Batch compression of many files (or whole directories) in one run, in a process or thread pool.
+
+Every file is compressed with HuffmanCodec to a binary container (or stored raw when it would not shrink). With
+--shared-table, one code table is built from the combined histogram of all the files and every file is compressed
+with it as a dictionary message (see train_dictionary in the compression script), so small files carry no table.
+
+The output is one indexed archive (--archive), or a file per input with a derived name: the input's name and
+BATCH_SUFFIX, next to the input or under --output-dir (the shared table goes to BATCH_DICTIONARY_NAME there, or in
+the common directory of the outputs, and decompress finds the nearest one above every output).
+
+usage:
+    python huffman_batch.py compress PATH [PATH ...] [--archive FILE | --output-dir DIR] [--shared-table]
+                                                     [--workers N] [--threads] [--max-code-length BITS] [--verify]
+    python huffman_batch.py extract ARCHIVE [NAME ...] [--output-dir DIR]
+    python huffman_batch.py list ARCHIVE
+    python huffman_batch.py decompress PATH [PATH ...] [--output-dir DIR] [--dictionary FILE]
+"""
+import os
+import struct
+import argparse
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from huffman_codec import HuffmanCodec
+from ID1_ID2_compression import DICTIONARY_MESSAGE_MAGIC, byte_histogram, encoded_size, container_header, \
+    histogram_dictionary, dictionary_table, write_dictionary, encode_varint
+from ID1_ID2_decompression import read_dictionary, decode_varint, is_dictionary_message, dictionary_message_id, \
+    bounded_map
+
+ARCHIVE_MAGIC = b'\x89HUB'  # first bytes of a batch archive
+ARCHIVE_VERSION = 1
+ARCHIVE_FLAG_SHARED_TABLE = 1  # the members are dictionary messages of the table in the archive header
+BATCH_SUFFIX = ".huf"  # appended to the input's name for per-file outputs
+BATCH_DICTIONARY_NAME = "batch.dict"  # shared table file of per-file outputs
+CONTAINER_HEADER_SIZE = len(container_header({}, 0, 0))
+DICTIONARY_HEADER_SIZE = len(DICTIONARY_MESSAGE_MAGIC) + 4 + 4  # magic, dictionary id and about a varint length
+
+worker_codec = None  # HuffmanCodec of a worker, with the shared table registered
+worker_dictionary = None  # tuple of the shared table's dictionary id and code lengths
+
+
+def init_worker(max_code_length=None, dictionary=None):
+    """
+    :param max_code_length: longest code allowed in bits, default - no limit
+    :param dictionary: tuple of the shared table's dictionary id and code lengths, default - a table per file
+    """
+    global worker_codec, worker_dictionary
+    worker_codec = HuffmanCodec(max_code_length=max_code_length)
+    worker_dictionary = dictionary
+    if dictionary is not None:
+        worker_codec.add_dictionary(*dictionary)
+
+
+def collect_files(paths, suffix=None) -> list:
+    """
+    Expand the input paths: a directory stands for all the files under it, recursively. Batch outputs found in a
+    directory (BATCH_SUFFIX files and the shared table) are skipped, so a rerun does not compress them again
+    :param paths: list of file and directory paths
+    :param suffix: take only the files with this suffix from the directories, and skip nothing else
+    :return: sorted list of tuples of file path and member name, the names are unique and use '/' separators:
+             a file under a directory given is named by its path relative to that directory, and a file given by
+             itself by its path relative to the common directory of all the files given by themselves
+    """
+    files = []
+    names = set()
+    single_files = [path for path in paths if os.path.isfile(path)]
+    base = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in single_files]) \
+        if single_files else None
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, directories, directory_files in os.walk(path):
+                directories.sort()
+                for name in sorted(directory_files):
+                    if suffix is not None and not name.endswith(suffix):
+                        continue
+                    if suffix is None and (name.endswith(BATCH_SUFFIX) or name == BATCH_DICTIONARY_NAME):
+                        continue
+                    file_path = os.path.join(directory, name)
+                    add_file(files, names, file_path, os.path.relpath(file_path, path))
+        elif os.path.isfile(path):
+            add_file(files, names, path, os.path.relpath(os.path.abspath(path), base))
+        else:
+            raise Exception(f"Did not found file name {path}")
+    return sorted(files, key=lambda x: x[1])
+
+
+def add_file(files: list, names: set, file_path, name: str):
+    name = name.replace(os.sep, '/')
+    if name in names:
+        raise Exception(f"two inputs have the same name {name}")
+    names.add(name)
+    files.append((file_path, name))
+
+
+def read_bytes(file_path) -> bytes:
+    with open(file_path, 'rb') as file:
+        return file.read()
+
+
+def file_histogram(file_path) -> dict:
+    """
+    :return: byte histogram of a file, runs in a worker
+    """
+    return byte_histogram(read_bytes(file_path))
+
+
+def compress_member(file_path) -> bytes:
+    """
+    Compress one file in a worker. With the shared table, a file that comes out smaller with a table of its own
+    (its distribution is far from the combined one) or stored raw gets its own container instead
+    :param file_path: file path
+    :return: compressed bytes
+    """
+    data = read_bytes(file_path)
+    if worker_dictionary is not None and data:
+        dictionary_id, code_lengths = worker_dictionary
+        histogram = byte_histogram(data)
+        own_lengths = worker_codec.code_table(histogram)[1]
+        own_size = min(encoded_size(histogram, own_lengths) + 4 * len(own_lengths), len(data)) + CONTAINER_HEADER_SIZE
+        if encoded_size(histogram, code_lengths) + DICTIONARY_HEADER_SIZE < own_size:
+            return worker_codec.compress(data, dictionary_id)
+    return worker_codec.compress(data)
+
+
+def compress_member_to(file_path, file_name: str) -> tuple:
+    """
+    Compress one file in a worker straight to its output file
+    :return: tuple of the original and the compressed size
+    """
+    compressed = compress_member(file_path)
+    os.makedirs(os.path.dirname(file_name) or '.', exist_ok=True)
+    with open(file_name, 'wb') as new_file:
+        new_file.write(compressed)
+    return os.path.getsize(file_path), len(compressed)
+
+
+def shared_dictionary(executor, files: list, workers: int, max_code_length=None) -> tuple:
+    """
+    One code table for all the files, from their combined histogram (counted in the pool)
+    :return: tuple of dictionary id and letter - code length hashmap
+    """
+    histogram = Counter()
+    for member_histogram in bounded_map(executor, file_histogram, [path for path, name in files],
+                                        max_pending=2 * workers):
+        histogram.update(member_histogram)
+    return histogram_dictionary(histogram, max_code_length)
+
+
+def make_executor(workers: int, threads=False, max_code_length=None, dictionary=None):
+    executor_type = ThreadPoolExecutor if threads else ProcessPoolExecutor
+    return executor_type(max_workers=workers, initializer=init_worker, initargs=(max_code_length, dictionary))
+
+
+def batch_compress(paths, archive=None, output_dir=None, shared_table=False, workers=None, threads=False,
+                   max_code_length=None, verify=False) -> tuple:
+    """
+    Compress many files in a worker pool.
+    Archive layout (numbers are big endian): magic (4 bytes) | version (1) | flags (1) |
+    with ARCHIVE_FLAG_SHARED_TABLE: dictionary id (4) and the code length of every byte (256) | the members |
+    index: members amount (4) and per member: name length (varint), utf-8 name, offset (8), length (8) |
+    index offset (8). A member is a binary container or a dictionary message
+    :param paths: list of file and directory paths, see collect_files
+    :param archive: archive file name to write to, default - a file per input
+    :param output_dir: directory of the per-file outputs (the member names are their paths under it), default -
+                       next to every input. The shared table of per-file outputs is written to output_dir, or to
+                       the common directory of the outputs, where batch_decompress finds it
+    :param shared_table: one code table from the combined histogram of all the files instead of a table per file
+    :param workers: workers amount, default - one per core
+    :param threads: a thread pool instead of a process pool
+    :param max_code_length: longest code allowed in bits, default - no limit
+    :param verify: decompress every output the way batch_decompress (or batch_extract) does and compare it with
+                   its input, raises an exception on a mismatch
+    :return: tuple of files amount, original bytes and compressed bytes
+    """
+    files = collect_files(paths)
+    workers = workers or os.cpu_count() or 1
+    dictionary = None
+    if shared_table and files:
+        with make_executor(workers, threads) as executor:
+            dictionary = shared_dictionary(executor, files, workers, max_code_length)
+    original_size = sum(os.path.getsize(path) for path, name in files)
+    with make_executor(workers, threads, max_code_length, dictionary) as executor:
+        if archive:
+            with open(archive, 'wb') as new_file:
+                new_file.write(ARCHIVE_MAGIC + struct.pack('>BB', ARCHIVE_VERSION,
+                                                           ARCHIVE_FLAG_SHARED_TABLE if dictionary else 0))
+                if dictionary:
+                    new_file.write(struct.pack('>I', dictionary[0]) + dictionary_table(dictionary[1]))
+                index = [struct.pack('>I', len(files))]
+                for (path, name), compressed in zip(files, bounded_map(executor, compress_member,
+                                                                       [path for path, name in files],
+                                                                       max_pending=2 * workers)):
+                    encoded_name = name.encode('utf-8')
+                    index.append(encode_varint(len(encoded_name)) + encoded_name +
+                                 struct.pack('>QQ', new_file.tell(), len(compressed)))
+                    new_file.write(compressed)
+                index_offset = new_file.tell()
+                new_file.write(b''.join(index) + struct.pack('>Q', index_offset))
+            if verify:
+                with open(archive, 'rb') as file:
+                    data = file.read()
+                archive_dictionary, members = read_archive_index(data)
+                codec = HuffmanCodec()
+                if archive_dictionary is not None:
+                    codec.add_dictionary(*archive_dictionary)
+                for (path, name), (member_name, offset, length) in zip(files, members):
+                    if codec.decompress(memoryview(data)[offset:offset + length]) != read_bytes(path):
+                        raise Exception(f"round trip failed for {path}")
+            return len(files), original_size, os.path.getsize(archive)
+        outputs = [os.path.join(output_dir, *name.split('/')) + BATCH_SUFFIX if output_dir else path + BATCH_SUFFIX
+                   for path, name in files]
+        if dictionary:
+            dictionary_dir = output_dir or os.path.commonpath([os.path.dirname(os.path.abspath(output))
+                                                               for output in outputs])
+            os.makedirs(dictionary_dir, exist_ok=True)
+            write_dictionary(os.path.join(dictionary_dir, BATCH_DICTIONARY_NAME), *dictionary)
+        compressed_size = sum(sizes[1] for sizes in executor.map(compress_member_to, [path for path, name in files],
+                                                                  outputs))
+    if verify:
+        codec = HuffmanCodec()
+        for (path, name), output in zip(files, outputs):
+            if decompress_file(output, codec) != read_bytes(path):
+                raise Exception(f"round trip failed for {path}")
+    return len(files), original_size, compressed_size
+
+
+def read_archive_index(data) -> tuple:
+    """
+    :param data: archive bytes, or an mmap of it
+    :return: tuple of the shared table (dictionary id and code lengths, None without one) and the list of tuples of
+             member name, offset and length
+    """
+    if data[:len(ARCHIVE_MAGIC)] != ARCHIVE_MAGIC:
+        raise Exception("not a Huffman batch archive!")
+    version, flags = struct.unpack_from('>BB', data, len(ARCHIVE_MAGIC))
+    if version != ARCHIVE_VERSION:
+        raise Exception(f"unsupported archive version {version}")
+    dictionary = None
+    if flags & ARCHIVE_FLAG_SHARED_TABLE:
+        idx = len(ARCHIVE_MAGIC) + 2
+        dictionary_id, = struct.unpack_from('>I', data, idx)
+        table = data[idx + 4:idx + 4 + 256]
+        dictionary = dictionary_id, {chr(integer_bits): length for integer_bits, length in enumerate(table)}
+    idx, = struct.unpack_from('>Q', data, len(data) - 8)
+    members_amount, = struct.unpack_from('>I', data, idx)
+    idx += 4
+    members = []
+    for _ in range(members_amount):
+        name_length, idx = decode_varint(data, idx)
+        name = bytes(data[idx:idx + name_length]).decode('utf-8')
+        offset, length = struct.unpack_from('>QQ', data, idx + name_length)
+        members.append((name, offset, length))
+        idx += name_length + 16
+    return dictionary, members
+
+
+def batch_extract(archive, output_dir='.', names=None) -> int:
+    """
+    Extract an archive's members (all of them, or only the given names) under output_dir
+    :param archive: archive file path
+    :param output_dir: directory to write to
+    :param names: member names, default - all the members
+    :return: members extracted
+    """
+    with open(archive, 'rb') as file:
+        data = file.read()
+    dictionary, members = read_archive_index(data)
+    init_worker(dictionary=dictionary)
+    if names:
+        missing = set(names) - {name for name, offset, length in members}
+        if missing:
+            raise Exception(f"no such members: {', '.join(sorted(missing))}")
+        members = [member for member in members if member[0] in names]
+    for name, offset, length in members:
+        file_name = os.path.join(output_dir, *name.split('/'))
+        os.makedirs(os.path.dirname(file_name) or '.', exist_ok=True)
+        with open(file_name, 'wb') as new_file:
+            new_file.write(worker_codec.decompress(memoryview(data)[offset:offset + length]))
+    return len(members)
+
+
+def find_dictionary(path, dictionary_id: int):
+    """
+    Find the shared table a per-file output needs: the nearest BATCH_DICTIONARY_NAME with its id, in the output's
+    directory or in a directory above it
+    :param path: compressed file path
+    :param dictionary_id: the id the file needs
+    :return: tuple of dictionary id and letter - code length hashmap
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    while True:
+        dictionary_file = os.path.join(directory, BATCH_DICTIONARY_NAME)
+        if os.path.exists(dictionary_file):
+            dictionary = read_dictionary(dictionary_file)
+            if dictionary[0] == dictionary_id:
+                return dictionary
+        if os.path.dirname(directory) == directory:
+            raise Exception(f"{path} needs dictionary {dictionary_id:08x}, no {BATCH_DICTIONARY_NAME} with it "
+                            f"was found above it, pass it with --dictionary")
+        directory = os.path.dirname(directory)
+
+
+def decompress_file(path, codec: HuffmanCodec, dictionary_path=None) -> bytes:
+    """
+    Decompress one per-file output, its shared table is registered in the codec on first use
+    :param path: compressed file path
+    :param codec: HuffmanCodec
+    :param dictionary_path: the shared table file, default - see find_dictionary
+    :return: original bytes
+    """
+    data = read_bytes(path)
+    if is_dictionary_message(data) and dictionary_message_id(data) not in codec.dictionaries:
+        dictionary_id = dictionary_message_id(data)
+        if dictionary_path:
+            dictionary = read_dictionary(dictionary_path)
+            if dictionary[0] != dictionary_id:
+                raise Exception(f"{path} needs dictionary {dictionary_id:08x}, {dictionary_path} is "
+                                f"{dictionary[0]:08x}")
+        else:
+            dictionary = find_dictionary(path, dictionary_id)
+        codec.add_dictionary(*dictionary)
+    return codec.decompress(data)
+
+
+def batch_decompress(paths, output_dir=None, dictionary_path=None) -> int:
+    """
+    Decompress per-file outputs of batch_compress, the output name drops BATCH_SUFFIX
+    :param paths: list of compressed file paths, and directories (all the BATCH_SUFFIX files under them)
+    :param output_dir: directory to write to (named as in collect_files), default - next to every input
+    :param dictionary_path: the shared table file, default - see find_dictionary
+    :return: files decompressed
+    """
+    codec = HuffmanCodec()
+    files = collect_files(paths, suffix=BATCH_SUFFIX)
+    for path, name in files:
+        if output_dir:
+            path_name = os.path.join(output_dir, *name.split('/'))
+        else:
+            path_name = path
+        file_name = path_name[:-len(BATCH_SUFFIX)] if path_name.endswith(BATCH_SUFFIX) else path_name + ".out"
+        original = decompress_file(path, codec, dictionary_path)
+        os.makedirs(os.path.dirname(file_name) or '.', exist_ok=True)
+        with open(file_name, 'wb') as new_file:
+            new_file.write(original)
+    return len(files)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Huffman batch compression")
+    commands = parser.add_subparsers(dest="command", required=True)
+    compress = commands.add_parser("compress", help="compress files and directories")
+    compress.add_argument("paths", nargs="+", help="files, and directories (all the files under them)")
+    compress.add_argument("--archive", metavar="FILE", default=None, help="write one indexed archive")
+    compress.add_argument("--output-dir", metavar="DIR", default=None,
+                          help="directory of the per-file outputs, default - next to every input")
+    compress.add_argument("--shared-table", action="store_true",
+                          help="one code table from the combined histogram of all the files")
+    compress.add_argument("--workers", type=int, default=None, help="workers amount, default - one per core")
+    compress.add_argument("--threads", action="store_true", help="a thread pool instead of a process pool")
+    compress.add_argument("--max-code-length", type=int, default=None, metavar="BITS",
+                          help="limit the codes to this many bits")
+    compress.add_argument("--verify", action="store_true",
+                          help="decompress every output after writing it and compare it with its input")
+    extract = commands.add_parser("extract", help="extract an archive")
+    extract.add_argument("archive")
+    extract.add_argument("names", nargs="*", help="members to extract, default - all")
+    extract.add_argument("--output-dir", metavar="DIR", default=".")
+    listing = commands.add_parser("list", help="list an archive's members")
+    listing.add_argument("archive")
+    decompress = commands.add_parser("decompress", help="decompress per-file outputs")
+    decompress.add_argument("paths", nargs="+", help="compressed files, and directories (all the "
+                            f"{BATCH_SUFFIX} files under them)")
+    decompress.add_argument("--output-dir", metavar="DIR", default=None)
+    decompress.add_argument("--dictionary", metavar="DICTIONARY_FILE", default=None,
+                            help=f"the shared table, default - the nearest {BATCH_DICTIONARY_NAME} above every input")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    if args.command == "compress":
+        files_amount, original_size, compressed_size = batch_compress(
+            args.paths, args.archive, args.output_dir, args.shared_table, args.workers, args.threads,
+            args.max_code_length, args.verify)
+        print(f"compressed {files_amount} files: {original_size} -> {compressed_size} bytes")
+    elif args.command == "extract":
+        print(f"extracted {batch_extract(args.archive, args.output_dir, args.names)} files")
+    elif args.command == "list":
+        with open(args.archive, 'rb') as file:
+            dictionary, members = read_archive_index(file.read())
+        for name, offset, length in members:
+            print(f"{length:>12} {name}")
+    elif args.command == "decompress":
+        print(f"decompressed {batch_decompress(args.paths, args.output_dir, args.dictionary)} files")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import threading
+from collections import OrderedDict
+
+from ID1_ID2_compression import CONTAINER_FLAG_BYTES, CONTAINER_FLAG_STORED, byte_histogram, build_canonical_code, \
+    encode_bytes, container_header, dictionary_compress, would_not_shrink, canonical_codes
+from ID1_ID2_decompression import CONTAINER_FLAG_INTERLEAVED, parse_container, canonical_decode_hash, \
+    build_decode_table, huffman_table_decoder, decode_interleaved_payload, is_dictionary_message, \
+    dictionary_message_id, dictionary_decompress
+
+CODE_TABLE_CACHE_SIZE = 256  # code tables (and decode tables) kept by default
+
+
+class LRUCache:
+    """
+    Small thread safe least-recently-used cache
+    """
+    def __init__(self, maxsize=CODE_TABLE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            try:
+                self.items.move_to_end(key)
+            except KeyError:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return self.items[key]
+
+    def put(self, key, value):
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+
+    def info(self) -> dict:
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self.items), "maxsize": self.maxsize}
+
+
+class HuffmanCodec:
+    """
+    In-process Huffman codec: compress(bytes) gives a binary container (the same format the compression script
+    writes with --bytes) and decompress(bytes) gives the original bytes back.
+    No files, no global state and no sleeps, so it can be called any number of times in one process.
+
+    Built code tables are kept in an LRU cache keyed by the histogram's fingerprint, so payloads with the same
+    distribution skip the tree construction. Decode tables are cached the same way, keyed by the code lengths.
+
+    Small messages can be compressed with a pre-trained dictionary (see train_dictionary in the compression
+    script), then the message header is only the dictionary id instead of a whole code table.
+
+    With max_code_length, no code is longer than that many bits, which bounds the decode tables' size.
+
+    Data that would not shrink (already compressed, random) is stored raw in the container, never expanded by
+    more than the container header, and in a dictionary compressed message by more than its header.
+    """
+    def __init__(self, cache_size=CODE_TABLE_CACHE_SIZE, max_code_length=None):
+        self.max_code_length = max_code_length
+        self.code_tables = LRUCache(cache_size)
+        self.decode_tables = LRUCache(cache_size)
+        self.dictionaries = {}  # dictionary id - (letter hashmap, decode table)
+
+    def add_dictionary(self, dictionary_id: int, code_lengths: dict):
+        """
+        Register a pre-trained dictionary (output of train_dictionary or read_dictionary)
+        :param dictionary_id: 32 bit id
+        :param code_lengths: letter - code length hashmap over the 256 byte values
+        :return: None
+        """
+        self.dictionaries[dictionary_id] = (canonical_codes(code_lengths),
+                                            build_decode_table(canonical_decode_hash(code_lengths)))
+
+    @staticmethod
+    def fingerprint(histogram: dict) -> tuple:
+        """
+        :param histogram: letter histogram
+        :return: hashable key, equal for equal histograms
+        """
+        return tuple(sorted(histogram.items()))
+
+    def code_table(self, histogram: dict):
+        """
+        :param histogram: letter histogram
+        :return: tuple of letter hashmap and letter - code length hashmap, from the cache when possible
+        """
+        key = self.fingerprint(histogram)
+        table = self.code_tables.get(key)
+        if table is None:
+            table = build_canonical_code(histogram, self.max_code_length)
+            self.code_tables.put(key, table)
+        return table
+
+    def decode_table(self, code_lengths: dict):
+        """
+        :param code_lengths: letter - code length hashmap
+        :return: output of build_decode_table, from the cache when possible
+        """
+        key = self.fingerprint(code_lengths)
+        table = self.decode_tables.get(key)
+        if table is None:
+            table = build_decode_table(canonical_decode_hash(code_lengths))
+            self.decode_tables.put(key, table)
+        return table
+
+    def compress(self, data: bytes, dictionary_id=None) -> bytes:
+        """
+        :param data: bytes
+        :param dictionary_id: compress with this registered dictionary, default - with the data's own code table
+        :return: binary container (or dictionary compressed message)
+        """
+        data = bytes(data)
+        if dictionary_id is not None:
+            return dictionary_compress(data, self.dictionaries[dictionary_id][0], dictionary_id)
+        if not data:
+            return container_header({}, 0, 0, CONTAINER_FLAG_BYTES)
+        histogram = byte_histogram(data)
+        huffman_code, code_lengths = self.code_table(histogram)
+        if would_not_shrink(histogram, code_lengths, len(data)):
+            return container_header({}, len(data), len(data), CONTAINER_FLAG_BYTES | CONTAINER_FLAG_STORED) + data
+        payload = encode_bytes(data, huffman_code)
+        return container_header(code_lengths, len(payload), len(data), CONTAINER_FLAG_BYTES) + payload
+
+    def decompress(self, data: bytes) -> bytes:
+        """
+        :param data: binary container or dictionary compressed message
+        :return: original bytes
+        """
+        if is_dictionary_message(data):
+            dictionary_id = dictionary_message_id(data)
+            if dictionary_id not in self.dictionaries:
+                raise KeyError(f"unknown dictionary {dictionary_id:08x}")
+            return dictionary_decompress(data, dictionary_id, self.dictionaries[dictionary_id][1])
+        code_lengths, payload, original_length, flags = parse_container(data)
+        with payload:
+            if not original_length:
+                return b''
+            if flags & CONTAINER_FLAG_STORED:  # utf-8 text or bytes, as they are
+                return bytes(payload)
+            if flags & CONTAINER_FLAG_INTERLEAVED:
+                original_text = decode_interleaved_payload(code_lengths, payload, original_length,
+                                                           self.decode_table(code_lengths))
+            else:
+                original_text = huffman_table_decoder(payload, self.decode_table(code_lengths),
+                                                      letters_amount=original_length)
+        if flags & CONTAINER_FLAG_BYTES:
+            return original_text.encode('latin-1')
+        return original_text.encode('utf-8')
+
+    def cache_info(self) -> dict:
+        """
+        :return: hits, misses and size of the code tables and decode tables caches
+        """
+        return {"code_tables": self.code_tables.info(), "decode_tables": self.decode_tables.info()}
@@ -0,0 +1,145 @@
+"""
+Opt-in instrumentation of the compression and decompression pipeline stages.
+
+Enabled by the HUFFMAN_PROFILE environment variable or the scripts' --profile / --profile-options flags, with a
+comma separated list of:
+    stages      - wall time, bytes in and out of every stage (any non empty value turns this on)
+    tracemalloc - also the allocation peak of every stage, above what was allocated when the stage started
+    cprofile    - also a cProfile of the whole run, the top functions go into the report
+The report is JSON, written to HUFFMAN_PROFILE_OUTPUT / --profile-output or to stderr.
+When disabled, stage() returns one shared do-nothing context manager, so the hooks cost a method call.
+"""
+import io
+import os
+import sys
+import json
+import cProfile
+import pstats
+import tracemalloc
+from time import perf_counter
+
+PROFILE_ENV = "HUFFMAN_PROFILE"
+PROFILE_OUTPUT_ENV = "HUFFMAN_PROFILE_OUTPUT"
+CPROFILE_TOP = 25  # functions listed from the cProfile, by cumulative time
+
+
+class NullStage:
+    """
+    Stage of a disabled profiler, bytes_out can be set and is ignored
+    """
+    bytes_out = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_STAGE = NullStage()
+
+
+class Stage:
+    """
+    One timed run of a pipeline stage, set bytes_out inside the with block
+    """
+    __slots__ = ("profiler", "name", "bytes_in", "bytes_out", "start", "memory_start")
+
+    def __init__(self, profiler, name: str, bytes_in: int):
+        self.profiler = profiler
+        self.name = name
+        self.bytes_in = bytes_in
+        self.bytes_out = 0
+        self.start = 0.0
+        self.memory_start = 0
+
+    def __enter__(self):
+        if self.profiler.trace_memory:
+            tracemalloc.reset_peak()
+            self.memory_start = tracemalloc.get_traced_memory()[0]
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = perf_counter() - self.start
+        peak = tracemalloc.get_traced_memory()[1] - self.memory_start if self.profiler.trace_memory else None
+        self.profiler.record(self.name, seconds, self.bytes_in, self.bytes_out, peak)
+        return False
+
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.trace_memory = False
+        self.cprofile = None
+        self.output = None
+        self.stages = {}  # stage name - totals, in the order the stages first ran
+        self.start = perf_counter()
+
+    def configure(self, spec: str, output=None):
+        """
+        :param spec: comma separated options, see the module doc
+        :param output: report file name, default - stderr
+        :return: None
+        """
+        options = {option.strip().lower() for option in spec.split(",") if option.strip()}
+        if not options or options <= {"0", "false", "off"}:
+            return
+        self.enabled = True
+        self.output = output
+        self.start = perf_counter()
+        if "tracemalloc" in options and not self.trace_memory:
+            self.trace_memory = True
+            tracemalloc.start()
+        if "cprofile" in options and self.cprofile is None:
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+
+    def stage(self, name: str, bytes_in=0):
+        """
+        :param name: stage name, runs with the same name are summed
+        :param bytes_in: size of the stage's input
+        :return: context manager around the stage's work
+        """
+        if not self.enabled:
+            return NULL_STAGE
+        return Stage(self, name, bytes_in)
+
+    def record(self, name: str, seconds: float, bytes_in: int, bytes_out: int, peak):
+        totals = self.stages.setdefault(name, {"calls": 0, "seconds": 0.0, "bytes_in": 0, "bytes_out": 0})
+        totals["calls"] += 1
+        totals["seconds"] += seconds
+        totals["bytes_in"] += bytes_in
+        totals["bytes_out"] += bytes_out
+        if peak is not None:
+            totals["peak_bytes"] = max(totals.get("peak_bytes", 0), peak)
+
+    def report(self) -> dict:
+        report = {
+            "total_seconds": perf_counter() - self.start,
+            "stages": [dict(stage=name, **totals) for name, totals in self.stages.items()],
+        }
+        if self.cprofile is not None:
+            self.cprofile.disable()
+            text = io.StringIO()
+            pstats.Stats(self.cprofile, stream=text).sort_stats("cumulative").print_stats(CPROFILE_TOP)
+            report["cprofile"] = text.getvalue().splitlines()
+        return report
+
+    def finish(self):
+        """
+        Write the report, if enabled
+        """
+        if not self.enabled:
+            return
+        report = json.dumps(self.report(), indent=2)
+        if self.output:
+            with open(self.output, "w") as file:
+                file.write(report)
+        else:
+            print(report, file=sys.stderr)
+
+
+profiler = Profiler()
+if os.environ.get(PROFILE_ENV):
+    profiler.configure(os.environ[PROFILE_ENV], os.environ.get(PROFILE_OUTPUT_ENV))
@@ -0,0 +1,262 @@
+"""
+Long-lived asyncio compression service over a local TCP or Unix socket, no interpreter start per call.
+
+Protocol, for requests and responses alike: one operation byte, a 4 byte big endian length, then the data.
+Operations: b'C' compress, b'D' decompress, b'S' statistics (the response is JSON). A response's operation byte
+is b'O' for success or b'E' for an error (the data is the error message).
+
+Small requests are batched: they wait in a queue up to BATCH_DELAY seconds (or until BATCH_SIZE of them are
+queued) and the whole batch goes to a worker process as one task. Large requests go to the worker pool alone.
+
+usage:
+    python huffman_server.py [--host 127.0.0.1] [--port 8765] [--unix PATH] [--workers N] [--stats-interval 10]
+"""
+import os
+import json
+import struct
+import asyncio
+import argparse
+from collections import deque
+from time import perf_counter
+from concurrent.futures import ProcessPoolExecutor
+
+from huffman_codec import HuffmanCodec
+
+OP_COMPRESS = b'C'
+OP_DECOMPRESS = b'D'
+OP_STATS = b'S'
+OP_OK = b'O'
+OP_ERROR = b'E'
+FRAME_HEADER = struct.Struct('>cI')  # operation byte and data length
+MAX_REQUEST_SIZE = 1 << 30
+SMALL_REQUEST = 1 << 16  # requests up to this size are batched
+BATCH_SIZE = 64  # requests per batch at most
+BATCH_DELAY = 0.002  # seconds the first request of a batch waits for more requests
+LATENCY_WINDOW = 10000  # latest latencies kept for the percentiles
+
+worker_codec = None  # HuffmanCodec of a worker process, its code table caches live as long as the worker
+
+
+def init_worker():
+    global worker_codec
+    worker_codec = HuffmanCodec()
+
+
+def run_request(operation: bytes, data: bytes) -> tuple:
+    """
+    Run one request in a worker process
+    :return: tuple of response operation and response data
+    """
+    try:
+        if operation == OP_COMPRESS:
+            return OP_OK, worker_codec.compress(data)
+        if operation == OP_DECOMPRESS:
+            return OP_OK, worker_codec.decompress(data)
+        return OP_ERROR, f"unknown operation {operation!r}".encode()
+    except Exception as e:
+        return OP_ERROR, str(e).encode()
+
+
+def run_batch(requests: list) -> list:
+    """
+    Run a batch of (operation, data) requests in a worker process
+    :return: list of run_request results, in order
+    """
+    return [run_request(operation, data) for operation, data in requests]
+
+
+class ServiceStats:
+    """
+    Per-request latency (queueing and work, without the network), queue depth and batch counters
+    """
+    def __init__(self):
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.requests = 0
+        self.errors = 0
+        self.batches = 0
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+
+    def queued(self):
+        self.queue_depth += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+
+    def done(self, latency: float, ok: bool):
+        self.queue_depth -= 1
+        self.requests += 1
+        self.errors += not ok
+        self.latencies.append(latency)
+
+    def report(self) -> dict:
+        latencies = sorted(self.latencies)
+
+        def percentile(fraction):
+            return latencies[min(int(fraction * len(latencies)), len(latencies) - 1)] * 1000 if latencies else 0.0
+
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "batches": self.batches,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "latency_ms": {"p50": percentile(0.5), "p99": percentile(0.99), "max": percentile(1.0)},
+        }
+
+
+class CompressionService:
+    """
+    The asyncio side: reads requests from the connections, batches the small ones and awaits the worker pool
+    """
+    def __init__(self, workers=None):
+        self.executor = ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1, initializer=init_worker)
+        self.queue = asyncio.Queue()
+        self.stats = ServiceStats()
+        self.batcher = None
+        self.tasks = set()  # running batch tasks, the event loop keeps only weak references to tasks
+
+    async def start(self):
+        self.batcher = asyncio.get_running_loop().create_task(self.run_batcher())
+
+    async def close(self):
+        self.batcher.cancel()
+        self.executor.shutdown(wait=True)
+
+    async def submit(self, operation: bytes, data: bytes) -> tuple:
+        """
+        :return: tuple of response operation and response data
+        """
+        start = perf_counter()
+        self.stats.queued()
+        if len(data) <= SMALL_REQUEST:
+            future = asyncio.get_running_loop().create_future()
+            await self.queue.put((operation, data, future))
+            result = await future
+        else:
+            result = await asyncio.get_running_loop().run_in_executor(self.executor, run_request, operation, data)
+        self.stats.done(perf_counter() - start, result[0] == OP_OK)
+        return result
+
+    async def run_batcher(self):
+        """
+        Collect small requests for up to BATCH_DELAY seconds and send every batch to the worker pool as one task.
+        The batches run concurrently, so a slow batch does not hold back the next ones
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + BATCH_DELAY
+            while len(batch) < BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            self.stats.batches += 1
+            task = loop.create_task(self.run_batch(batch))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def run_batch(self, batch: list):
+        futures = [future for operation, data, future in batch]
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                self.executor, run_batch, [(operation, data) for operation, data, future in batch])
+        except Exception as e:
+            results = [(OP_ERROR, str(e).encode())] * len(batch)
+        for future, result in zip(futures, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Serve the requests of one connection in order, until the client closes it
+        """
+        try:
+            while True:
+                try:
+                    operation, length = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+                except asyncio.IncompleteReadError:
+                    break
+                if length > MAX_REQUEST_SIZE:
+                    writer.write(frame(OP_ERROR, b"request too large"))
+                    break
+                data = await reader.readexactly(length)
+                if operation == OP_STATS:
+                    result = (OP_OK, json.dumps(self.stats.report()).encode())
+                else:
+                    result = await self.submit(operation, data)
+                writer.write(frame(*result))
+                await writer.drain()
+        finally:
+            writer.close()
+
+
+def frame(operation: bytes, data: bytes) -> bytes:
+    return FRAME_HEADER.pack(operation, len(data)) + data
+
+
+async def request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, operation: bytes, data=b'') -> bytes:
+    """
+    Client side of one request, on an open connection
+    :param operation: OP_COMPRESS, OP_DECOMPRESS or OP_STATS
+    :param data: request data
+    :return: response data
+    """
+    writer.write(frame(operation, data))
+    await writer.drain()
+    response_operation, length = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+    response = await reader.readexactly(length)
+    if response_operation != OP_OK:
+        raise Exception(response.decode(errors='replace'))
+    return response
+
+
+async def report_stats(stats: ServiceStats, interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        print(json.dumps(stats.report()), flush=True)
+
+
+async def serve(host="127.0.0.1", port=8765, unix_path=None, workers=None, stats_interval=0):
+    service = CompressionService(workers)
+    await service.start()
+    if unix_path:
+        server = await asyncio.start_unix_server(service.handle_connection, path=unix_path)
+    else:
+        server = await asyncio.start_server(service.handle_connection, host=host, port=port)
+    stats_task = None
+    if stats_interval:
+        stats_task = asyncio.get_running_loop().create_task(report_stats(service.stats, stats_interval))
+    print(f"serving on {unix_path or f'{host}:{port}'}", flush=True)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        if stats_task is not None:
+            stats_task.cancel()
+        await service.close()
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Huffman compression service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", metavar="PATH", default=None, help="listen on a Unix socket instead of TCP")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes, default - one per core")
+    parser.add_argument("--stats-interval", type=float, default=0,
+                        help="print the latency and queue depth statistics every this many seconds")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix, args.workers, args.stats_interval))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
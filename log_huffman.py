@@ -0,0 +1,176 @@
+import os
+import struct
+from collections import Counter
+
+from ID1_ID2_compression import STREAM_CHUNK_SIZE, DRIFT_THRESHOLD, byte_histogram, encode_bytes, \
+    histogram_dictionary, dictionary_table, canonical_codes
+from ID1_ID2_decompression import build_decode_table, huffman_table_decoder, canonical_decode_hash
+
+LOG_MAGIC = b'\x89HUL'  # first bytes of an append-only log archive
+LOG_VERSION = 1
+LOG_STATE_MAGIC = b'\x89HUS'  # first bytes of a log archive's state file
+LOG_STATE_SUFFIX = ".hist"  # the state file is the archive's name and this suffix
+TABLE_RECORD = b'T'
+BLOCK_RECORD = b'B'
+
+
+def read_log_state(archive) -> tuple:
+    """
+    Read the state file of a log archive: magic (4 bytes) | version (1) | source bytes compressed so far (8) |
+    archive size (8) | the current table, code length of every byte (256) | the merged histogram, count of every
+    byte (8 each, 256)
+    :param archive: log archive path
+    :return: tuple of source offset, letter - code length hashmap and letter histogram
+    """
+    with open(archive + LOG_STATE_SUFFIX, 'rb') as file:
+        data = file.read()
+    if data[:len(LOG_STATE_MAGIC)] != LOG_STATE_MAGIC:
+        raise Exception("not a log archive state file!")
+    version, source_offset, archive_size = struct.unpack_from('>BQQ', data, len(LOG_STATE_MAGIC))
+    if version != LOG_VERSION:
+        raise Exception(f"unsupported log state version {version}")
+    if archive_size != os.path.getsize(archive):
+        raise Exception("the state file does not match the archive, it was changed after the last append")
+    idx = len(LOG_STATE_MAGIC) + struct.calcsize('>BQQ')
+    code_lengths = {chr(integer_bits): length for integer_bits, length in enumerate(data[idx:idx + 256])}
+    counts = struct.unpack_from('>256Q', data, idx + 256)
+    histogram = {chr(integer_bits): count for integer_bits, count in enumerate(counts) if count}
+    return source_offset, code_lengths, histogram
+
+
+def write_log_state(archive, source_offset: int, code_lengths: dict, histogram: dict):
+    """
+    Write the state file of a log archive, see read_log_state
+    """
+    counts = [histogram.get(chr(integer_bits), 0) for integer_bits in range(0, 256)]
+    with open(archive + LOG_STATE_SUFFIX, 'wb') as new_file:
+        new_file.write(LOG_STATE_MAGIC + struct.pack('>BQQ', LOG_VERSION, source_offset, os.path.getsize(archive)))
+        new_file.write(dictionary_table(code_lengths) + struct.pack('>256Q', *counts))
+
+
+def read_byte_chunks(file_path, start: int, end: int, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    :param file_path: file path
+    :param start: first byte to read
+    :param end: byte to stop at, bytes appended after it are left for the next call
+    :param chunk_size: bytes per chunk
+    :return: generator of the bytes chunks
+    """
+    with open(file_path, 'rb') as file:
+        file.seek(start)
+        while start < end:
+            chunk = file.read(min(chunk_size, end - start))
+            if not chunk:
+                break
+            start += len(chunk)
+            yield chunk
+
+
+def table_drift(histogram: dict, code_lengths: dict, new_code_lengths: dict) -> float:
+    """
+    :param histogram: letter histogram
+    :param code_lengths: the current table
+    :param new_code_lengths: the table the histogram would get
+    :return: expected bits per byte the current table loses against the new one, over the histogram
+    """
+    letters_amount = sum(histogram.values())
+    if not letters_amount:
+        return 0.0
+    current = sum(count * code_lengths[letter] for letter, count in histogram.items())
+    new = sum(count * new_code_lengths[letter] for letter, count in histogram.items())
+    return (current - new) / letters_amount
+
+
+def log_append(file_path, archive, chunk_size=STREAM_CHUNK_SIZE, drift_threshold=DRIFT_THRESHOLD,
+               max_code_length=None) -> tuple:
+    """
+    Compress the bytes appended to a log since the last call and append them to the log archive as new blocks.
+    Only the new bytes are read (twice, a histogram pass and an encoding pass, a chunk at a time): their histogram
+    is merged into the persisted one, and a new code table is built from the merged histogram only when the current
+    one is more than drift_threshold bits per byte worse than it, so an append costs about the appended bytes.
+    Tables cover all the 256 byte values, so a byte never seen before can still be coded with the current table.
+    Archive layout: LOG_MAGIC | version (1) | records, a table record: TABLE_RECORD | code length of every byte
+    (256), or a block record: BLOCK_RECORD | original length (8) | payload length (8) | payload, coded with the
+    last table before it
+    :param file_path: the log file
+    :param archive: log archive path, created on the first call (with its state file, see read_log_state)
+    :param chunk_size: bytes per block
+    :param drift_threshold: bits per byte, see table_drift
+    :param max_code_length: longest code allowed in bits, default - no limit
+    :return: tuple of bytes appended, blocks appended and the drift (None when a new table was built)
+    """
+    source_size = os.path.getsize(file_path)
+    if os.path.exists(archive) and os.path.exists(archive + LOG_STATE_SUFFIX):
+        source_offset, code_lengths, histogram = read_log_state(archive)
+        if source_size < source_offset:
+            raise Exception("the log is shorter than what was already compressed, was it rotated?")
+    else:
+        with open(archive, 'wb') as new_file:
+            new_file.write(LOG_MAGIC + struct.pack('>B', LOG_VERSION))
+        source_offset, code_lengths, histogram = 0, None, {}
+
+    histogram = Counter(histogram)
+    for chunk in read_byte_chunks(file_path, source_offset, source_size, chunk_size):
+        histogram.update(byte_histogram(chunk))
+
+    drift = None if code_lengths is None else 0.0
+    new_table = None
+    if source_size > source_offset:
+        new_code_lengths = histogram_dictionary(histogram, max_code_length)[1]
+        if code_lengths is not None:
+            drift = table_drift(histogram, code_lengths, new_code_lengths)
+        if drift is None or drift > drift_threshold:
+            code_lengths = new_table = new_code_lengths
+            drift = None
+
+    blocks = 0
+    with open(archive, 'ab') as new_file:
+        if new_table is not None:
+            new_file.write(TABLE_RECORD + dictionary_table(new_table))
+        huffman_code = canonical_codes(code_lengths) if code_lengths is not None else None
+        for block in read_byte_chunks(file_path, source_offset, source_size, chunk_size):
+            payload = encode_bytes(block, huffman_code)
+            new_file.write(BLOCK_RECORD + struct.pack('>QQ', len(block), len(payload)) + payload)
+            blocks += 1
+    if code_lengths is not None:
+        write_log_state(archive, source_size, code_lengths, histogram)
+    return source_size - source_offset, blocks, drift
+
+
+def log_decoding(file_path):
+    """
+    Decode a log archive record by record
+    :param file_path: log archive path
+    :return: generator of the original bytes, block by block
+    """
+    with open(file_path, 'rb') as file:
+        if file.read(len(LOG_MAGIC)) != LOG_MAGIC:
+            raise Exception("not a log archive!")
+        version, = struct.unpack('>B', file.read(1))
+        if version != LOG_VERSION:
+            raise Exception(f"unsupported log archive version {version}")
+        decode_table = None
+        record = file.read(1)
+        while record:
+            if record == TABLE_RECORD:
+                code_lengths = {chr(integer_bits): length for integer_bits, length in enumerate(file.read(256))}
+                decode_table = build_decode_table(canonical_decode_hash(code_lengths))
+            elif record == BLOCK_RECORD:
+                original_length, payload_length = struct.unpack('>QQ', file.read(16))
+                payload = file.read(payload_length)
+                yield huffman_table_decoder(payload, decode_table, letters_amount=original_length).encode('latin-1')
+            else:
+                raise Exception(f"unknown log archive record {record!r}")
+            record = file.read(1)
+
+
+def log_decompress(file_path, file_name: str):
+    """
+    Decompress a log archive
+    :param file_path: log archive path
+    :param file_name: file name to write to
+    :return: None
+    """
+    with open(file_name, 'wb') as new_file:
+        for block in log_decoding(file_path):
+            new_file.write(block)
@@ -0,0 +1,40 @@
+"""
+Command line checks: the scripts run in a fresh interpreter inside a temporary directory, the same as a user runs
+them (they write ID1_ID2_compressed.txt / ID1_ID2_decompressed.txt to the working directory).
+"""
+import os
+import sys
+import json
+import subprocess
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COMPRESSION = os.path.join(REPO, "ID1_ID2_compression.py")
+DECOMPRESSION = os.path.join(REPO, "ID1_ID2_decompression.py")
+TEXT = "the quick brown fox jumps over the lazy dog\n" * 200
+
+
+def run(script, *args, cwd):
+    return subprocess.run([sys.executable, script, *args], cwd=cwd, capture_output=True, text=True, timeout=120)
+
+
+def round_trip(tmp_path, *compress_args):
+    source = tmp_path / "source.txt"
+    source.write_text(TEXT)
+    compressed = run(COMPRESSION, *compress_args, cwd=tmp_path)
+    assert compressed.returncode == 0, compressed.stdout + compressed.stderr
+    decompressed = run(DECOMPRESSION, "ID1_ID2_compressed.txt", cwd=tmp_path)
+    assert decompressed.returncode == 0, decompressed.stdout + decompressed.stderr
+    assert (tmp_path / "ID1_ID2_decompressed.txt").read_text() == TEXT
+    return compressed
+
+
+def test_profile_before_the_file_name(tmp_path):
+    compressed = round_trip(tmp_path, "--profile", "source.txt")
+    stages = [stage["stage"] for stage in json.loads(compressed.stderr)["stages"]]
+    assert "read_file" in stages
+
+
+def test_profile_options(tmp_path):
+    compressed = round_trip(tmp_path, "--profile-options", "stages,tracemalloc", "source.txt")
+    stages = json.loads(compressed.stderr)["stages"]
+    assert all(stage["peak_bytes"] >= 0 for stage in stages)
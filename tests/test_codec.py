@@ -0,0 +1,20 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from huffman_codec import HuffmanCodec  # noqa: E402
+from ID1_ID2_compression import train_dictionary  # noqa: E402
+
+SAMPLE = b"GET /index.html HTTP/1.1\r\nHost: example.com\r\nAccept: */*\r\n\r\n" * 20
+
+
+def test_dictionary_message_never_expands_past_its_header():
+    codec = HuffmanCodec()
+    dictionary_id, code_lengths = train_dictionary([SAMPLE])
+    codec.add_dictionary(dictionary_id, code_lengths)
+    for data in (b'', b'x', bytes(range(47)), bytes(range(256)) * 4, SAMPLE[:60]):
+        message = codec.compress(data, dictionary_id)
+        assert codec.decompress(message) == data
+        assert len(message) <= len(data) + 3 + 4 + 2  # magic, dictionary id and a two byte varint
+    assert len(codec.compress(SAMPLE[:60], dictionary_id)) < 60
@@ -0,0 +1,93 @@
+import os
+import sys
+import random
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+import pytest  # noqa: E402
+
+import ID1_ID2_decompression  # noqa: E402
+from ID1_ID2_compression import Node, filter_abc, sort_histogram, build_huffman_tree, build_huffman_codes, \
+    build_canonical_code, make_text_bytes, escape_bytes, stream_compress, parallel_compress  # noqa: E402
+from ID1_ID2_decompression import build_decode_table, huffman_table_decoder, stored_range, text_decoding, \
+    stream_decoding, parallel_decoding  # noqa: E402
+
+
+def fibonacci_text(letters: int) -> str:
+    counts = [1, 1]
+    while len(counts) < letters:
+        counts.append(counts[-1] + counts[-2])
+    text = [chr(97 + i) for i, count in enumerate(counts) for _ in range(count)]
+    random.Random(1).shuffle(text)
+    return ''.join(text)
+
+
+with open(os.path.join(REPO, "Alice_in_wonderlands.txt")) as alice:
+    TEXTS = {
+        "alice": alice.read(20000),
+        "skewed": fibonacci_text(20),  # codes up to 19 bits, past the primary table
+        "single": 'a' * 1000,
+        "two letters": ''.join(random.Random(3).choice('ab') for _ in range(999)),
+        "unicode": ''.join(random.Random(4).choice('ab \u00e9\u20ac\U0001d11e') for _ in range(3000)),
+    }
+
+
+def tree_codes(text: str) -> dict:
+    histogram = sort_histogram(filter_abc(text))
+    root = build_huffman_tree([(Node(letters=letter, count=count), count) for letter, count in histogram],
+                              len(histogram))
+    return build_huffman_codes(root)
+
+
+def pack_bits(bits: str) -> bytes:
+    bits += '0' * (-len(bits) % 8)
+    return int(bits, 2).to_bytes(len(bits) // 8, 'big') if bits else b''
+
+
+def test_table_decoder_codes_longer_than_a_refill():
+    huffman_hash = {'1' * length + '0': chr(65 + length) for length in range(0, 90)}
+    huffman_hash['1' * 90] = chr(65 + 90)
+    letter_codes = {letter: code for code, letter in huffman_hash.items()}
+    text = chr(65 + 89) * 5 + ''.join(random.Random(2).choice(sorted(letter_codes)) for _ in range(3000))
+    data = pack_bits(''.join(letter_codes[letter] for letter in text))
+    assert huffman_table_decoder(data, build_decode_table(huffman_hash), letters_amount=len(text)) == text
+
+
+def test_stored_range_of_multibyte_text(monkeypatch):
+    monkeypatch.setattr(ID1_ID2_decompression, "STORED_SCAN_BYTES", 3)  # letters split between the scanned chunks
+    text = ''.join(random.Random(5).choice('ab \u00e9\u20ac\U0001d11e\n') for _ in range(500))
+    payload = b'header' + text.encode('utf-8')
+    for start, length in ((0, 10), (7, 1), (123, 200), (499, 5), (500, 3), (-1, 4)):
+        expected = text[start:start + length] if start >= 0 else ''
+        assert stored_range(payload, 6, len(payload) - 6, start, length, 0, len(text)) == expected
+
+
+@pytest.mark.parametrize("name", sorted(TEXTS))
+@pytest.mark.parametrize("codes", ["tree", "canonical"])
+def test_reference_and_table_decoders_agree(name, codes):
+    text = TEXTS[name]
+    huffman_code = tree_codes(text) if codes == "tree" else build_canonical_code(filter_abc(text))[0]
+    huffman_hash = {code: letter for letter, code in huffman_code.items()}
+    encoded = escape_bytes(make_text_bytes(text, huffman_code))
+    reference = text_decoding(encoded, huffman_hash, reference=True)
+    assert reference == text
+    assert text_decoding(encoded, huffman_hash) == reference
+
+
+@pytest.mark.parametrize("name", sorted(TEXTS))
+def test_reference_and_block_decoders_agree(name, tmp_path):
+    text = TEXTS[name]
+    source = tmp_path / "source.txt"
+    source.write_text(text, encoding='utf-8')
+    huffman_code = build_canonical_code(filter_abc(text))[0]
+    reference = text_decoding(escape_bytes(make_text_bytes(text, huffman_code)),
+                              {code: letter for letter, code in huffman_code.items()}, reference=True)
+    stream_compress(str(source), str(tmp_path / "stream"), chunk_size=4000)
+    assert (tmp_path / "stream").read_bytes().startswith(b'S|')  # not rewritten as a stored file
+    assert ''.join(stream_decoding(str(tmp_path / "stream"))) == reference
+    for shared_table in (False, True):
+        parallel_compress(str(source), str(tmp_path / "parallel"), chunk_size=4000, workers=2,
+                          shared_table=shared_table)
+        assert (tmp_path / "parallel").read_bytes().startswith(b'P|')
+        assert ''.join(parallel_decoding(str(tmp_path / "parallel"), workers=2)) == reference
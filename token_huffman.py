@@ -0,0 +1,155 @@
+import re
+import struct
+from math import log2
+from collections import Counter
+
+from ID1_ID2_compression import CONTAINER_FLAG_BYTES, BitWriter, build_canonical_code, container_header, \
+    write_text_codes, encode_varint
+from ID1_ID2_decompression import parse_container, decode_container_payload, decode_varint
+
+TOKEN_MAGIC = b'\x89HUT'  # first bytes of a file compressed over a token alphabet
+TOKEN_VERSION = 1
+WORD_PATTERN = re.compile(rb'[A-Za-z0-9]+|[^A-Za-z0-9]')  # a word, or any other single byte
+MIN_TOKEN_COUNT = 2  # rarer tokens are escaped, sent as their bytes
+MAX_VOCABULARY = 1 << 16  # tokens in the vocabulary at most, on top of the 256 byte values
+TOKENIZERS = ("words", "ngrams")
+
+
+def tokenize(data: bytes, tokenizer="words", ngram_size=2):
+    """
+    Split bytes into tokens
+    :param data: bytes
+    :param tokenizer: "words" - words of letters and digits, and every other byte on its own,
+                      "ngrams" - consecutive chunks of ngram_size bytes (the last one may be shorter)
+    :param ngram_size: bytes per n-gram
+    :return: generator of bytes tokens, their concatenation is the data
+    """
+    if tokenizer == "words":
+        for match in WORD_PATTERN.finditer(data):
+            yield match.group()
+    elif tokenizer == "ngrams":
+        for i in range(0, len(data), ngram_size):
+            yield data[i: i + ngram_size]
+    else:
+        raise Exception(f"unknown tokenizer {tokenizer}, use one of: {', '.join(TOKENIZERS)}")
+
+
+def build_vocabulary(token_histogram: dict, max_size=MAX_VOCABULARY) -> list:
+    """
+    Pick the tokens worth a symbol of their own: longer than a byte, seen at least MIN_TOKEN_COUNT times, and
+    expected to save more bits than they cost in the header. A token's code is estimated at log2(tokens / count)
+    bits and its escaped bytes at log2(bytes / byte count) bits each, the header costs its bytes, a length byte and
+    a code length entry. The tokens that save the most come first
+    :param token_histogram: token - count hashmap
+    :param max_size: tokens in the vocabulary at most
+    :return: list of bytes tokens, a token's symbol is 256 + its index
+    """
+    byte_counts = Counter()
+    for token, count in token_histogram.items():
+        for integer_bits in token:
+            byte_counts[integer_bits] += count
+    bytes_amount = sum(byte_counts.values())
+    tokens_amount = sum(token_histogram.values())
+    byte_bits = {integer_bits: log2(bytes_amount / count) for integer_bits, count in byte_counts.items()}
+    candidates = []
+    for token, count in token_histogram.items():
+        if len(token) > 1 and count >= MIN_TOKEN_COUNT:
+            saved = count * (sum(byte_bits[integer_bits] for integer_bits in token) - log2(tokens_amount / count))
+            saved -= 8 * (len(token) + 1) + 32
+            if saved > 0:
+                candidates.append((saved, token))
+    candidates.sort(key=lambda x: (-x[0], x[1]))
+    return [token for saved, token in candidates[:max_size]]
+
+
+def token_symbols(data: bytes, vocabulary: list, tokenizer="words", ngram_size=2) -> str:
+    """
+    Turn bytes into a string of symbols, one character per symbol: chr(byte) for a byte and chr(256 + index) for a
+    vocabulary token. A token out of the vocabulary is escaped, written as the symbols of its bytes, so the
+    alphabet is the Huffman alphabet the rest of the code already works with (single character letters)
+    :param data: bytes
+    :param vocabulary: output of build_vocabulary
+    :param tokenizer: see tokenize
+    :param ngram_size: see tokenize
+    :return: string of symbols
+    """
+    token_letters = {token: chr(256 + i) for i, token in enumerate(vocabulary)}
+    return ''.join(token_letters.get(token) or token.decode('latin-1')
+                   for token in tokenize(data, tokenizer, ngram_size))
+
+
+def token_compress_bytes(data: bytes, tokenizer="words", ngram_size=2, max_code_length=None) -> bytes:
+    """
+    Compress bytes over a token alphabet. Layout (numbers are big endian):
+    magic (4 bytes) | version (1) | vocabulary size (4) | per token: length (varint) and bytes |
+    binary container of the symbols string (see write_container in the compression script)
+    :param data: bytes
+    :param tokenizer: see tokenize
+    :param ngram_size: see tokenize
+    :param max_code_length: longest code allowed in bits, default - no limit
+    :return: compressed bytes
+    """
+    vocabulary = build_vocabulary(Counter(tokenize(data, tokenizer, ngram_size)))
+    header = bytearray(TOKEN_MAGIC + struct.pack('>BI', TOKEN_VERSION, len(vocabulary)))
+    for token in vocabulary:
+        header += encode_varint(len(token)) + token
+    symbols = token_symbols(data, vocabulary, tokenizer, ngram_size)
+    if not symbols:
+        return bytes(header) + container_header({}, 0, 0, CONTAINER_FLAG_BYTES)
+    huffman_code, code_lengths = build_canonical_code(Counter(symbols), max_code_length)
+    writer = BitWriter()
+    write_text_codes(writer, symbols, huffman_code)
+    payload = writer.getvalue()
+    return bytes(header) + container_header(code_lengths, len(payload), len(symbols), CONTAINER_FLAG_BYTES) + payload
+
+
+def token_decompress_bytes(data) -> bytes:
+    """
+    Decompress the output of token_compress_bytes
+    :param data: bytes
+    :return: original bytes
+    """
+    if data[:len(TOKEN_MAGIC)] != TOKEN_MAGIC:
+        raise Exception("not a token Huffman file!")
+    version, vocabulary_size = struct.unpack_from('>BI', data, len(TOKEN_MAGIC))
+    if version != TOKEN_VERSION:
+        raise Exception(f"unsupported token file version {version}")
+    idx = len(TOKEN_MAGIC) + 5
+    symbol_bytes = [bytes([integer_bits]) for integer_bits in range(0, 256)]
+    for _ in range(vocabulary_size):
+        length, idx = decode_varint(data, idx)
+        symbol_bytes.append(bytes(data[idx:idx + length]))
+        idx += length
+    code_lengths, payload, original_length, flags = parse_container(memoryview(data)[idx:])
+    with payload:
+        symbols = decode_container_payload(code_lengths, payload, original_length)
+    return b''.join([symbol_bytes[ord(letter)] for letter in symbols])
+
+
+def token_compress(file_path, file_name: str, tokenizer="words", ngram_size=2, max_code_length=None):
+    """
+    Compress a file over a token alphabet, see token_compress_bytes
+    :param file_path: file to compress
+    :param file_name: file name to write to
+    :param tokenizer: see tokenize
+    :param ngram_size: see tokenize
+    :param max_code_length: longest code allowed in bits, default - no limit
+    :return: None
+    """
+    with open(file_path, 'rb') as file:
+        data = file.read()
+    with open(file_name, 'wb') as new_file:
+        new_file.write(token_compress_bytes(data, tokenizer, ngram_size, max_code_length))
+
+
+def token_decompress(file_path, file_name: str):
+    """
+    Decompress a file written by token_compress
+    :param file_path: file to decompress
+    :param file_name: file name to write to
+    :return: None
+    """
+    with open(file_path, 'rb') as file:
+        data = file.read()
+    with open(file_name, 'wb') as new_file:
+        new_file.write(token_decompress_bytes(data))